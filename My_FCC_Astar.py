@@ -7,9 +7,9 @@
 import pygame
 import sys
 import math
-import heapq
 import random
 import config
+from open_list import make_open_list
 
 SCREEN_WIDTH = config.SCREEN_WIDTH
 SCREEN_HEIGHT = config.SCREEN_HEIGHT
@@ -78,7 +78,7 @@ def smooth_heading(path_list, k=3):
 
 # My_FCC_Astar.py (新增 / 替換)
 def a_star_search_time_heading(start_col, start_row, start_heading,
-                               goal_col, goal_row, blocked):
+                               goal_col, goal_row, blocked, open_list="heap"):
     """
     回傳一條路徑(陣列):
     [(px1, py1, t1, heading1),
@@ -87,6 +87,7 @@ def a_star_search_time_heading(start_col, start_row, start_heading,
      (pxn, pyn, tn, headingn)]
     - 狀態 = (col, row, t, heading)
     - heading 先用 8 方向離散計算 (或你也可改成其他方式)
+    - open_list: OPEN 串列，"heap" 或可無參數建立 OPEN 串列的類別，見 open_list.py
     """
     
     # 8方向 (dc, dr)
@@ -102,19 +103,19 @@ def a_star_search_time_heading(start_col, start_row, start_heading,
         dy = abs(r1 - r2)
         return (math.sqrt(2) - 1)*min(dx, dy) + max(dx, dy)
     
-    # openHeap: (f_cost, (col, row, t, heading))
+    # openHeap: f_cost -> (col, row, t, heading)
     start_state = (start_col, start_row, 0, start_heading)
     goal_xy = (goal_col, goal_row)
     
     g_cost = {start_state: 0}
     f_start = heuristic(start_col, start_row, goal_col, goal_row)
-    openHeap = []
-    heapq.heappush(openHeap, (f_start, start_state))
+    openHeap = make_open_list(open_list)
+    openHeap.push(f_start, 0, start_state)
     parent = {}
     visited = set()
 
     while openHeap:
-        current_f, current_state = heapq.heappop(openHeap)
+        current_f, current_state = openHeap.pop()
         c, r, t, hdg = current_state
         
         # 是否到達目標 (col, row)
@@ -165,6 +166,6 @@ def a_star_search_time_heading(start_col, start_row, start_heading,
                 f_cost = new_g + heuristic(nc, nr, goal_col, goal_row)
                 parent[neighbor_state] = current_state
                 if neighbor_state not in visited:
-                    heapq.heappush(openHeap, (f_cost, neighbor_state))
+                    openHeap.push(f_cost, new_g, neighbor_state)
     
     return []  # 找不到路徑
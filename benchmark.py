@@ -0,0 +1,756 @@
+# benchmark.py
+
+"""
+路徑規劃效能量測
+以 main.py 的 5 船包圍情境 (或 ship_navigation_v1 的示範資料) 量測各種規劃選項
+
+用法：
+  python benchmark.py [fcc_modes] [distance_field] [anytime] [incremental] [open_list] [fcc_cache] [warm_start] [solvers] [cbs_workers] [parallel_retry] [conflict_check] [smoothing] [plan_cache] [ring_slots] ...
+  (不給名稱則全部執行)
+"""
+
+import itertools
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from multi_ship_planner_v1 import n_fcc_a, IncrementalPlanner
+from My_FCC_Astar import a_star_search_time_heading
+from open_list import OPEN_LISTS
+from plan_cache import PlanCache
+import numpy as np
+
+from ship_navigation_v1 import (
+    SOLVERS,
+    assign_ring_slots,
+    PathConflictIndex,
+    multi_ship_planning,
+    paths_conflict,
+    paths_conflict_array,
+    paths_conflict_batch,
+    moving_average_smooth,
+    recalc_headings,
+)
+
+# 與 main.py 相同的像素 <-> 公尺換算
+CONVERT_SIZE = 25
+
+
+def encirclement_scenario(num_boats=config.BOAT_NUM, enemy_pos=None, rotation_steps=None):
+    """
+    產生與 main.py mode2_recal 相同形式的包圍情境 (單位：公尺)：
+      - 船隊以 main.py 的初始隊形朝敵船前進，直到最近的船進入 alg_radius
+      - 第 idx 艘船的目標為敵船周圍 around_radius 圓上角度 2π·idx/N 的位置；
+        給 rotation_steps 時改以 assign_ring_slots 做最小距離指派 (同現在的 mode2_recal)
+    """
+    if enemy_pos is None:
+        enemy_pos = (config.SCREEN_WIDTH // 3 * 1, config.SCREEN_HEIGHT // 3 * 2)
+    around_radius = config.ENEMY_RADIUS * 5
+    alg_radius = config.ENEMY_RADIUS * 10
+
+    # main.py 的初始隊形 (像素)
+    starts = []
+    for i in range(num_boats):
+        if i % 2 == 1:
+            starts.append((200 + (i // 2 + 1) * 70, 200 - (i // 2 + 1) * 70))
+        else:
+            starts.append((200 - (i // 2) * 70, 200 - (i // 2) * 70))
+
+    # 整個隊形沿「隊形中心 -> 敵船」方向平移，直到最近的船距敵船 alg_radius
+    cx = sum(p[0] for p in starts) / num_boats
+    cy = sum(p[1] for p in starts) / num_boats
+    ux, uy = enemy_pos[0] - cx, enemy_pos[1] - cy
+    norm = math.hypot(ux, uy)
+    ux, uy = ux / norm, uy / norm
+    nearest = min(math.hypot(enemy_pos[0] - x, enemy_pos[1] - y) for x, y in starts)
+    shift = nearest - alg_radius
+
+    starts = [(x + ux * shift, y + uy * shift) for x, y in starts]
+    if rotation_steps is not None:
+        goals, _ = assign_ring_slots(starts, enemy_pos, around_radius, rotation_steps=rotation_steps)
+        goals = goals.tolist()
+    else:
+        goals = []
+        for idx in range(num_boats):
+            theta = (2 * math.pi / num_boats) * idx
+            goals.append(
+                (
+                    enemy_pos[0] + around_radius * math.cos(theta),
+                    enemy_pos[1] + around_radius * math.sin(theta),
+                )
+            )
+
+    ships = []
+    for idx, ((x, y), (gx, gy)) in enumerate(zip(starts, goals)):
+        ships.append(
+            {
+                "id": str(idx + 1),
+                "pos": (x / CONVERT_SIZE, y / CONVERT_SIZE),
+                "goal": (gx / CONVERT_SIZE, gy / CONVERT_SIZE),
+            }
+        )
+    return ships
+
+
+def demo_scenario():
+    """ship_navigation_v1.main() 的 5 船示範資料 (有多次衝突重算)"""
+    return [
+        {"id": "ShipA", "pos": (2.2, 1.5), "goal": (17.4, 9.7)},
+        {"id": "ShipB", "pos": (5.1, 1.5), "goal": (15.3, 8.7)},
+        {"id": "ShipC", "pos": (7.9, 1.5), "goal": (14.7, 12.4)},
+        {"id": "ShipD", "pos": (7.9, -1.4), "goal": (13.7, 10.3)},
+        {"id": "ShipE", "pos": (7.9, -4.2), "goal": (17.1, 12.1)},
+    ]
+
+
+def _sum_search_stats(results):
+    total = {}
+    for data in results.values():
+        for k, v in data["analysis"].get("search_stats", {}).items():
+            total[k] = total.get(k, 0) + v
+    return total
+
+
+def bench_fcc_modes():
+    """
+    比較 fcc_mode="heuristic" 與 "edge" 的展開數、推入數與耗時。
+    "edge" 為實驗性：啟發式的 FCC 下界太弱，展開數與耗時都是 "heuristic" 的數倍
+    """
+    scenarios = [
+        ("encirclement", encirclement_scenario()),
+        ("demo", demo_scenario()),
+    ]
+    for name, ships in scenarios:
+        for fcc_mode in ("heuristic", "edge"):
+            t0 = time.perf_counter()
+            results = multi_ship_planning(
+                ships,
+                safe_distance=1,
+                grid_scale=0.2,
+                planner_kwargs={"bounded": True, "fcc_mode": fcc_mode},
+            )
+            elapsed = time.perf_counter() - t0
+            stats = _sum_search_stats(results)
+            label = fcc_mode if fcc_mode == "heuristic" else f"{fcc_mode}(exp)"
+            print(
+                f"{name:12s} fcc_mode={label:9s} "
+                f"expansions={stats.get('expansions', 0):8d} "
+                f"pushes={stats.get('pushes', 0):8d} "
+                f"g_updates={stats.get('g_updates', 0):6d} "
+                f"stale_pops={stats.get('stale_pops', 0):6d} "
+                f"time={elapsed:.3f}s"
+            )
+
+
+def bench_distance_field(num_replans=5, enemy_steps_px=(2, 16)):
+    """
+    模擬 mode2_recal 連續重算：敵船每次移動 enemy_step_px 像素
+    (2 像素不到一格，目標格不變、距離表可沿用；16 像素約同遊戲中的移動，每次都要重建)，
+    比較八方向距離與 DistanceField (含跨次快取) 的展開數與耗時
+    """
+    enemy_x = config.SCREEN_WIDTH // 3 * 1
+    enemy_y = config.SCREEN_HEIGHT // 3 * 2
+    for enemy_step_px in enemy_steps_px:
+        for use_distance_field in (False, True):
+            cache = {}
+            total_time = 0.0
+            total_stats = {}
+            for i in range(num_replans):
+                ships = encirclement_scenario(
+                    enemy_pos=(enemy_x + i * enemy_step_px, enemy_y)
+                )
+                t0 = time.perf_counter()
+                results = multi_ship_planning(
+                    ships,
+                    safe_distance=1,
+                    grid_scale=0.2,
+                    planner_kwargs={"bounded": True},
+                    use_distance_field=use_distance_field,
+                    distance_field_cache=cache,
+                )
+                total_time += time.perf_counter() - t0
+                for k, v in _sum_search_stats(results).items():
+                    total_stats[k] = total_stats.get(k, 0) + v
+            print(
+                f"step={enemy_step_px:2d}px use_distance_field={str(use_distance_field):5s} "
+                f"replans={num_replans} expansions={total_stats.get('expansions', 0):8d} "
+                f"time={total_time:.3f}s"
+            )
+
+
+def _encirclement_last_ship(grid_scale=0.2):
+    """
+    包圍情境中：先規劃前 N-1 艘船，回傳 (最後一艘船的 ship_info, 其餘船的路徑作為干擾船)
+    """
+    ships = encirclement_scenario()
+    results = multi_ship_planning(
+        ships[:-1], grid_scale=grid_scale, planner_kwargs={"bounded": True}
+    )
+    interfering_paths = [
+        {"path": data["path"][:, :2].tolist(), "headings": data["headings"].tolist()}
+        for data in results.values()
+        if len(data["path"])
+    ]
+    last = ships[-1]
+    return {"pos": last["pos"], "goal": last["goal"]}, interfering_paths
+
+
+def bench_anytime(budgets=(0.05, 0.2, 1.0, 3.0)):
+    """以不同時間預算執行 ARA* (fcc_mode="edge")，列出每輪權重、路徑成本與次佳上界"""
+    ship_info, interfering_paths = _encirclement_last_ship()
+    for budget in budgets:
+        planner = n_fcc_a(
+            ship_info,
+            interfering_paths,
+            grid_scale=0.2,
+            bounded=True,
+            fcc_mode="edge",
+        )
+        t0 = time.perf_counter()
+        path_m, _ = planner.calculate_path(deadline=t0 + budget)
+        elapsed = time.perf_counter() - t0
+        stats = planner.search_stats
+        rounds = ", ".join(
+            f"w={w} cost={cost:.1f} bound={bound:.3f} @{t:.3f}s"
+            for w, cost, bound, t in planner.anytime_stats["iterations"]
+        )
+        print(
+            f"budget={budget:5.2f}s took={elapsed:.3f}s steps={len(path_m):4d} "
+            f"timed_out={stats['timed_out']} [{rounds}]"
+        )
+
+
+def bench_incremental(num_replans=4, goal_step_m=0.3):
+    """
+    最後一艘船的目標每次移動 goal_step_m 公尺 (起點不動)，
+    比較每次重新搜索與 IncrementalPlanner 沿用搜索樹的展開數與耗時 (fcc_mode="edge")
+    """
+    ship_info, interfering_paths = _encirclement_last_ship()
+    incremental = IncrementalPlanner(grid_scale=0.2, bounded=True, fcc_mode="edge")
+    for i in range(num_replans):
+        info = {
+            "pos": ship_info["pos"],
+            "goal": (ship_info["goal"][0] + i * goal_step_m, ship_info["goal"][1]),
+        }
+        fresh = n_fcc_a(info, interfering_paths, grid_scale=0.2, bounded=True, fcc_mode="edge")
+        t0 = time.perf_counter()
+        fresh_path, _ = fresh.calculate_path()
+        fresh_time = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        inc_path, _ = incremental.plan(info, interfering_paths)
+        inc_time = time.perf_counter() - t0
+        print(
+            f"replan={i} fresh: expansions={fresh.search_stats['expansions']:8d} "
+            f"time={fresh_time:.3f}s | incremental: "
+            f"expansions={incremental.planner.search_stats['expansions']:8d} "
+            f"time={inc_time:.3f}s same_path={fresh_path == inc_path}"
+        )
+    print(incremental.stats)
+
+
+def _counting_open_list(name, counter):
+    """回傳會把 pop 次數累加到 counter["pops"] 的 OPEN 串列建構函式"""
+    base = OPEN_LISTS[name]
+
+    class CountingOpenList(base):
+        def pop(self):
+            counter["pops"] += 1
+            return base.pop(self)
+
+    return CountingOpenList
+
+
+def bench_open_list(num_pops=200_000, branching=8):
+    """
+    OPEN_LISTS 中各 OPEN 串列每秒可取出的節點數 (pops/s)；新的 OPEN 串列要在 n_fcc_a /
+    My_FCC_Astar 中也勝過 "heap" 才值得加入：
+      - queue：只有佇列本身，模擬 A* 每次取出一個、推入 branching 個 f 略增的節點
+      - n_fcc_a：包圍情境最後一艘船 (fcc_mode="heuristic" / "edge")
+      - My_FCC_Astar：整個畫面網格、無障礙，由左上走到右下
+    """
+    rng = random.Random(0)
+    pushes = [
+        (rng.random() * 3.0, rng.random() * 2.0) for _ in range(num_pops * branching)
+    ]
+    for name, cls in OPEN_LISTS.items():
+        queue = cls()
+        queue.push(0.0, 0.0, 0)
+        i = 0
+        t0 = time.perf_counter()
+        for n in range(num_pops):
+            f, _ = queue.pop()
+            for _ in range(branching):
+                df, g = pushes[i]
+                queue.push(f + df, g + n, i)
+                i += 1
+        elapsed = time.perf_counter() - t0
+        print(f"queue         open_list={name:6s} pops/s={num_pops / elapsed:12.0f}")
+
+    ship_info, interfering_paths = _encirclement_last_ship()
+    for fcc_mode in ("heuristic", "edge"):
+        for name in OPEN_LISTS:
+            counter = {"pops": 0}
+            planner = n_fcc_a(
+                ship_info,
+                interfering_paths,
+                grid_scale=0.2,
+                bounded=True,
+                fcc_mode=fcc_mode,
+                open_list=_counting_open_list(name, counter),
+            )
+            t0 = time.perf_counter()
+            path_m, _ = planner.calculate_path()
+            elapsed = time.perf_counter() - t0
+            print(
+                f"n_fcc_a {fcc_mode:9s} open_list={name:6s} "
+                f"pops/s={counter['pops'] / elapsed:12.0f} pops={counter['pops']:8d} "
+                f"time={elapsed:.3f}s steps={len(path_m)}"
+            )
+
+    cols = config.SCREEN_WIDTH // config.GRID_SIZE
+    rows = config.SCREEN_HEIGHT // config.GRID_SIZE
+    for name in OPEN_LISTS:
+        counter = {"pops": 0}
+        t0 = time.perf_counter()
+        path = a_star_search_time_heading(
+            0, 0, 0, cols - 1, rows - 1, set(), open_list=_counting_open_list(name, counter)
+        )
+        elapsed = time.perf_counter() - t0
+        print(
+            f"My_FCC_Astar  open_list={name:6s} "
+            f"pops/s={counter['pops'] / elapsed:12.0f} pops={counter['pops']:8d} "
+            f"time={elapsed:.3f}s steps={len(path)}"
+        )
+
+
+def bench_fcc_cache():
+    """
+    包圍情境最後一艘船：比較 FCC 取得方式的耗時與命中率
+      - memo：只記住搜索中實際用到的 (t, x, y) (fcc_memo=True，預設)
+      - off：每次都逐點計算
+    再以整個多船規劃比較兩種設定的總耗時 (路徑應相同)。
+    預先建立整個 (t, x, y) 成本體積的做法比兩者都慢 (約 0.83s 對 0.12s / 0.058s)，已移除
+    """
+    ship_info, interfering_paths = _encirclement_last_ship()
+    variants = [
+        ("memo", {"fcc_memo": True}),
+        ("off", {"fcc_memo": False}),
+    ]
+    for fcc_mode in ("heuristic", "edge"):
+        for name, kwargs in variants:
+            planner = n_fcc_a(
+                ship_info,
+                interfering_paths,
+                grid_scale=0.2,
+                bounded=True,
+                fcc_mode=fcc_mode,
+                **kwargs,
+            )
+            t0 = time.perf_counter()
+            path_m, _ = planner.calculate_path()
+            elapsed = time.perf_counter() - t0
+            cache = planner.analysis["fcc_cache"]
+            print(
+                f"fcc_mode={fcc_mode:9s} {name:5s} hits={cache['hits']:8d} "
+                f"misses={cache['misses']:8d} time={elapsed:.3f}s steps={len(path_m)}"
+            )
+
+    scenarios = [
+        ("demo", demo_scenario()),
+        ("encirclement", encirclement_scenario()),
+    ]
+    for name, ships in scenarios:
+        paths = {}
+        for variant, kwargs in variants:
+            t0 = time.perf_counter()
+            results = multi_ship_planning(ships, grid_scale=0.2, planner_kwargs=kwargs)
+            elapsed = time.perf_counter() - t0
+            paths[variant] = [data["path"] for data in results.values()]
+            print(f"{name:12s} multi_ship_planning {variant:5s} time={elapsed:.3f}s")
+        same = all(
+            np.array_equal(a, b) for a, b in zip(paths["memo"], paths["off"])
+        )
+        print(f"{name:12s} same_paths={same}")
+
+
+def _count_conflicts(results, safe_distance=1):
+    """規劃結果中仍互相衝突的船對數"""
+    return sum(
+        paths_conflict_array(a["path"], b["path"], safe_distance)
+        for a, b in itertools.combinations(results.values(), 2)
+    )
+
+
+def bench_warm_start():
+    """
+    衝突重算時從上一次的搜索樹繼續 (warm_start=True，fcc_mode="heuristic") 與重新搜索比較：
+    耗時，以及規劃完成後仍互相衝突的船對數
+    """
+    scenarios = [
+        ("demo", demo_scenario()),
+        ("encirclement", encirclement_scenario()),
+        ("encirclement8", encirclement_scenario(num_boats=8)),
+    ]
+    for name, ships in scenarios:
+        for warm_start in (False, True):
+            t0 = time.perf_counter()
+            results = multi_ship_planning(ships, grid_scale=0.2, warm_start=warm_start)
+            elapsed = time.perf_counter() - t0
+            conflicts = _count_conflicts(results)
+            print(
+                f"{name:14s} warm_start={str(warm_start):5s} "
+                f"time={elapsed:.3f}s remaining_conflicts={conflicts}"
+            )
+
+
+def bench_solvers():
+    """比較各 solver 的耗時、規劃後仍衝突的船對數與總步數"""
+    scenarios = [
+        ("demo", demo_scenario()),
+        ("encirclement", encirclement_scenario()),
+        ("encirclement8", encirclement_scenario(num_boats=8)),
+    ]
+    for name, ships in scenarios:
+        for solver in SOLVERS:
+            t0 = time.perf_counter()
+            results = multi_ship_planning(
+                ships,
+                grid_scale=0.2,
+                solver=solver,
+            )
+            elapsed = time.perf_counter() - t0
+            total_steps = sum(len(data["path"]) for data in results.values())
+            print(
+                f"{name:14s} solver={solver:12s} time={elapsed:.3f}s "
+                f"remaining_conflicts={_count_conflicts(results)} total_steps={total_steps}"
+            )
+
+
+def bench_cbs_workers(worker_counts=(1, 2, 4)):
+    """
+    CBS 低層搜索以 process pool 平行執行：不同行程數的耗時 (結果應相同)。
+    pool=new 每次規劃都建立 process pool；pool=reused 沿用呼叫端的 executor (同 PlannerProcess)
+    """
+    ships = encirclement_scenario()
+    for workers in worker_counts:
+        runs = [("new", None)]
+        executor = None
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            # 先跑一次讓子行程啟動、載入模組，下面量的是沿用時的耗時
+            multi_ship_planning(
+                ships,
+                grid_scale=0.2,
+                solver="cbs",
+                executor=executor,
+            )
+            runs.append(("reused", executor))
+        for pool, run_executor in runs:
+            t0 = time.perf_counter()
+            results = multi_ship_planning(
+                ships,
+                grid_scale=0.2,
+                solver="cbs",
+                solver_kwargs={"workers": workers},
+                executor=run_executor,
+            )
+            elapsed = time.perf_counter() - t0
+            cbs_stats = next(iter(results.values()))["analysis"]["cbs"]
+            print(
+                f"workers={workers} pool={pool:6s} time={elapsed:.3f}s "
+                f"nodes_expanded={cbs_stats['nodes_expanded']} "
+                f"low_level_calls={cbs_stats['low_level_calls']} "
+                f"remaining_conflicts={_count_conflicts(results)}"
+            )
+        if executor is not None:
+            executor.shutdown()
+
+
+def bench_parallel_retry(worker_counts=(1, 2, 4, 8)):
+    """
+    solver="retry" 依序規劃與平行規劃 (solver_kwargs["workers"]) 的耗時；路徑應完全相同。
+    critical_path 為各輪最久的一組的耗時總和，即核心數足夠時的規劃耗時下限；
+    實際耗時只有在 CPU 核心數 (cpus=) 不少於 workers 時才有意義
+    """
+    scenarios = [
+        ("demo", demo_scenario()),
+        ("encirclement", encirclement_scenario()),
+        ("encirclement10", encirclement_scenario(num_boats=10)),
+    ]
+    for name, ships in scenarios:
+        t0 = time.perf_counter()
+        serial = multi_ship_planning(ships, grid_scale=0.2)
+        print(
+            f"{name:14s} serial     time={time.perf_counter() - t0:.3f}s "
+            f"cpus={os.cpu_count()}"
+        )
+        for workers in worker_counts:
+            t0 = time.perf_counter()
+            results = multi_ship_planning(
+                ships, grid_scale=0.2, solver_kwargs={"workers": workers}
+            )
+            elapsed = time.perf_counter() - t0
+            parallel_stats = next(iter(results.values()))["analysis"]["parallel"]
+            same = all(np.array_equal(results[k]["path"], serial[k]["path"]) for k in serial)
+            print(
+                f"{name:14s} workers={workers:<3d} time={elapsed:.3f}s "
+                f"critical_path={parallel_stats['critical_path']:.3f}s "
+                f"groups={parallel_stats['groups']} rounds={parallel_stats['rounds']} "
+                f"reused={parallel_stats['reused']} same_paths={same}"
+            )
+
+
+def bench_conflict_check(repeats=20):
+    """
+    多船規劃中的衝突比對：逐船呼叫 paths_conflict (原做法)、PathConflictIndex 時空雜湊、
+    逐船呼叫 paths_conflict_array，以及 paths_conflict_batch 一次比對。
+    以實際規劃出的路徑，模擬「每艘船與前面所有已確定的船比對、再加入」的流程
+    (陣列版本在船加入時轉成陣列，計入時間)。
+    5 艘 (實際船隊) 時 paths_conflict 最快，約 8 艘起 paths_conflict_batch 較快，
+    據此設定 CONFLICT_BATCH_MIN_SHIPS / CONFLICT_INDEX_MIN_SHIPS
+    """
+    scenarios = [
+        ("demo", demo_scenario()),
+        ("encirclement", encirclement_scenario()),
+        ("encirclement10", encirclement_scenario(num_boats=10)),
+        ("encirclement15", encirclement_scenario(num_boats=15)),
+        ("encirclement20", encirclement_scenario(num_boats=20)),
+        ("encirclement30", encirclement_scenario(num_boats=30)),
+    ]
+    for name, ships in scenarios:
+        results = multi_ship_planning(ships, grid_scale=0.2)
+        paths = [data["path"][:, :2].tolist() for data in results.values() if len(data["path"])]
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            reference = []
+            for i, path in enumerate(paths):
+                reference.append(
+                    [j for j in range(i) if paths_conflict(path, paths[j], 1)]
+                )
+        t_reference = (time.perf_counter() - t0) / repeats
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            indexed = []
+            index = PathConflictIndex(1)
+            for i, path in enumerate(paths):
+                indexed.append([s["id"] for s in index.conflicts(path)])
+                index.add({"id": i, "path": path})
+        t_index = (time.perf_counter() - t0) / repeats
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            pairwise = []
+            arrays = []
+            for path in paths:
+                path_array = np.asarray(path, dtype=float)
+                pairwise.append(
+                    [j for j, other in enumerate(arrays) if paths_conflict_array(path_array, other, 1)]
+                )
+                arrays.append(path_array)
+        t_array = (time.perf_counter() - t0) / repeats
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            batched = []
+            arrays = []
+            for path in paths:
+                path_array = np.asarray(path, dtype=float)
+                hit = paths_conflict_batch(path_array, arrays, 1)
+                batched.append(np.flatnonzero(hit).tolist())
+                arrays.append(path_array)
+        t_batch = (time.perf_counter() - t0) / repeats
+        same = indexed == reference and pairwise == reference and batched == reference
+        print(
+            f"{name:14s} ships={len(paths):2d} paths_conflict={t_reference * 1e3:.2f}ms "
+            f"index={t_index * 1e3:.2f}ms array={t_array * 1e3:.2f}ms "
+            f"batch={t_batch * 1e3:.2f}ms same={same}"
+        )
+
+
+def _moving_average_smooth_loop(path, window_size=4):
+    """原本逐點 np.mean 的移動平均 (對照基準)"""
+    if len(path) < window_size:
+        return path[:]
+    smoothed = []
+    half_window = window_size // 2
+    for i in range(len(path)):
+        indices = range(max(0, i - half_window), min(len(path), i + half_window + 1))
+        avg_x = np.mean([path[j][0] for j in indices])
+        avg_y = np.mean([path[j][1] for j in indices])
+        smoothed.append((avg_x, avg_y))
+    return smoothed
+
+
+def _recalc_headings_loop(path):
+    """原本逐點 math.atan2 的航向計算 (對照基準)"""
+    headings = []
+    for i in range(len(path) - 1):
+        dx = path[i + 1][0] - path[i][0]
+        dy = path[i + 1][1] - path[i][1]
+        angle = math.degrees(math.atan2(dy, dx))
+        headings.append((90 - angle) % 360)
+    headings.append(headings[-1] if len(path) > 1 else 0.0)
+    return headings
+
+
+def bench_smoothing(sizes=(100, 1_000, 10_000), seed=0):
+    """移動平均平滑化與航向重算：原本的逐點迴圈 vs 陣列版本 (列表輸入 / 陣列輸入) 每條路徑的耗時"""
+    rng = random.Random(seed)
+    for n in sizes:
+        # 每步一格 (0.2 m) 的隨機路徑
+        x = y = 0.0
+        path = []
+        for _ in range(n):
+            path.append((x, y))
+            x += rng.choice((-0.2, 0.0, 0.2))
+            y += rng.choice((-0.2, 0.0, 0.2))
+        path_array = np.asarray(path)
+        repeats = max(1, 20_000 // n)
+
+        def per_path(func, arg):
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                func(arg)
+            return (time.perf_counter() - t0) / repeats * 1e3
+
+        same = [tuple(map(float, p)) for p in _moving_average_smooth_loop(path)] == (
+            moving_average_smooth(path)
+        )
+        max_heading_diff = max(
+            abs(a - b) for a, b in zip(_recalc_headings_loop(path), recalc_headings(path))
+        )
+        print(
+            f"n={n:6d} moving_average loop={per_path(_moving_average_smooth_loop, path):8.3f}ms "
+            f"list={per_path(moving_average_smooth, path):7.3f}ms "
+            f"array={per_path(moving_average_smooth, path_array):7.3f}ms same={same}"
+        )
+        print(
+            f"n={n:6d} headings       loop={per_path(_recalc_headings_loop, path):8.3f}ms "
+            f"list={per_path(recalc_headings, path):7.3f}ms "
+            f"array={per_path(recalc_headings, path_array):7.3f}ms "
+            f"max_diff={max_heading_diff:.1e}deg"
+        )
+
+
+def bench_plan_cache(num_replans=12, step_px=15, seed=0):
+    """
+    模擬敵船隨機移動 (每次 step_px 像素內) 的連續重算，比較不用快取與 PlanCache：
+    命中率、總耗時、仍衝突的船對數 (修正後出現新衝突的命中視為未命中，計入 rejected)；
+    再以存檔後重新載入的快取跑第二次 (跨次執行)。
+    規劃參數與 main.py 的規劃行程相同 (最小距離指派目標、moving_average、bounded)
+    """
+    rng = random.Random(seed)
+    enemy_x = config.SCREEN_WIDTH // 3 * 1
+    enemy_y = config.SCREEN_HEIGHT // 3 * 2
+    enemy_positions = []
+    for _ in range(num_replans):
+        enemy_positions.append((enemy_x, enemy_y))
+        enemy_x += rng.uniform(-step_px, step_px)
+        enemy_y += rng.uniform(-step_px, step_px)
+    kwargs = {
+        "smoothing_method": "moving_average",
+        "planner_kwargs": {"bounded": True, "analysis": "off"},
+    }
+
+    def run(cache):
+        total_time = 0.0
+        conflicts = 0
+        for enemy_pos in enemy_positions:
+            ships = encirclement_scenario(enemy_pos=enemy_pos, rotation_steps=1)
+            t0 = time.perf_counter()
+            if cache is None:
+                results = multi_ship_planning(ships, **kwargs)
+            else:
+                origin = (enemy_pos[0] / CONVERT_SIZE, enemy_pos[1] / CONVERT_SIZE)
+                results = cache.plan(ships, origin, **kwargs)
+            total_time += time.perf_counter() - t0
+            conflicts += _count_conflicts(results)
+        return total_time, conflicts
+
+    total_time, conflicts = run(None)
+    print(f"no cache      replans={num_replans} time={total_time:.3f}s conflicts={conflicts}")
+
+    fd, path = tempfile.mkstemp(suffix=".pkl")
+    os.close(fd)
+    os.remove(path)
+    try:
+        for label in ("cold cache", "reloaded"):
+            cache = PlanCache(path=path)
+            total_time, conflicts = run(cache)
+            cache.save()
+            print(
+                f"{label:13s} replans={num_replans} time={total_time:.3f}s conflicts={conflicts} "
+                f"hits={cache.stats['hits']} misses={cache.stats['misses']} "
+                f"rejected={cache.stats['rejected']} "
+                f"hit_rate={cache.hit_rate:.2f} entries={len(cache)}"
+            )
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _count_crossings(ships):
+    """起點 -> 目標連線互相交叉的船對數"""
+
+    def side(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+    count = 0
+    for s1, s2 in itertools.combinations(ships, 2):
+        p1, q1, p2, q2 = s1["pos"], s1["goal"], s2["pos"], s2["goal"]
+        if side(p1, q1, p2) * side(p1, q1, q2) < 0 and side(p2, q2, p1) * side(p2, q2, q1) < 0:
+            count += 1
+    return count
+
+
+def bench_ring_slots(boat_counts=(5, 10)):
+    """
+    包圍圈目標分配：依順序 (2π·idx/N) vs 最小距離指派 (不旋轉 / 搜尋 8 個旋轉角度)，
+    比較連線交叉數、multi_ship_planning 的耗時、展開數與仍衝突的船對數
+    """
+    for num_boats in boat_counts:
+        for label, rotation_steps in (("index", None), ("assigned", 1), ("assigned+rot8", 8)):
+            ships = encirclement_scenario(num_boats=num_boats, rotation_steps=rotation_steps)
+            t0 = time.perf_counter()
+            results = multi_ship_planning(
+                ships, grid_scale=0.2, planner_kwargs={"bounded": True}
+            )
+            elapsed = time.perf_counter() - t0
+            stats = _sum_search_stats(results)
+            print(
+                f"boats={num_boats:2d} {label:13s} crossings={_count_crossings(ships):2d} "
+                f"time={elapsed:.3f}s expansions={stats.get('expansions', 0):8d} "
+                f"conflicts={_count_conflicts(results)}"
+            )
+
+
+BENCHMARKS = {
+    "fcc_modes": bench_fcc_modes,
+    "distance_field": bench_distance_field,
+    "anytime": bench_anytime,
+    "incremental": bench_incremental,
+    "open_list": bench_open_list,
+    "fcc_cache": bench_fcc_cache,
+    "warm_start": bench_warm_start,
+    "solvers": bench_solvers,
+    "cbs_workers": bench_cbs_workers,
+    "parallel_retry": bench_parallel_retry,
+    "conflict_check": bench_conflict_check,
+    "smoothing": bench_smoothing,
+    "plan_cache": bench_plan_cache,
+    "ring_slots": bench_ring_slots,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"=== {name} ===")
+        BENCHMARKS[name]()
@@ -6,6 +6,7 @@
 
 import pygame
 import math
+import numpy as np
 from pygame.math import Vector2
 from boat_algorithm import *
 import config
@@ -52,7 +53,7 @@ class Boat:
         self.id = boat_id
 
         # 紀錄算好的路徑資訊
-        self.path = []  # 用來儲存 A* 結果 [(x1,y1), (x2,y2), ...]
+        self.path = np.empty((0, 4), dtype=np.float32)  # A* 結果，(N, 4) 陣列，每列 (x, y, t, heading) (像素)
         self.path_index = 0  # 目前走到路徑的哪個中繼點(或終點)
 
         # 避讓參數
@@ -241,7 +242,7 @@ class Boat:
                 if self.path_index >= len(self.path):
                     self.path_index = len(self.path) - 1
                     break
-                px, py, step_t, hdg = self.path[self.path_index]
+                px, py = self.path[self.path_index, :2]
                 self.temp_destin = Vector2(px, py)
                 target_to_destin = self.destination - self.temp_destin
         return
@@ -255,7 +256,7 @@ class Boat:
         # 若路徑還沒走完
         if self.path_index < len(self.path) and self.destination != None:
             # 取得目前應該前往的中繼點資訊
-            px, py, step_t, hdg = self.path[self.path_index]
+            px, py = self.path[self.path_index, :2]
             self.temp_destin = Vector2(px, py)
 
             # 更新橢圓大小
@@ -0,0 +1,282 @@
+# cbs_solver.py
+
+"""
+Conflict-Based Search (CBS) 多船求解器
+
+  - 高層：約束樹 (constraint tree)。每個節點記錄各船的約束與路徑，
+    每次取出衝突最少 (其次總步數最少) 的節點，找出最早的一對衝突船
+    (同一時間步距離 < safe_distance)，分成兩個子節點，各自對其中一艘船加上該時間步的約束：
+      - 船已停在終點：頂點約束，該時間步不可位於目前的格子
+      - 船在移動中：邊約束，該時間步不可做出目前這一步的移動
+    兩艘船都照原本的位置 / 移動就一定衝突，故無衝突的解至少滿足其中一個分支
+  - 低層：n_fcc_a，以 ConstraintTable 表示該船的約束，並以約束樹上曾與它衝突的船
+    (在此節點的路徑) 作為干擾船計入 FCC，與 solver="retry" 相同的成本，
+    單一時間步的約束才能很快讓開 safe_distance
+  - 預算：max_nodes 個約束樹節點或 time_limit 秒，低層每次搜索最多 low_level_time 秒；
+    用完時回傳目前衝突最少的節點
+
+根節點各船、以及同一節點兩個子節點的低層搜索彼此獨立，以 process pool 平行執行。
+本模組不 import pygame，子行程只需載入 multi_ship_planner_v1。
+"""
+
+import heapq
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from multi_ship_planner_v1 import n_fcc_a, CancellationToken, ConstraintTable
+
+# 約束樹最多展開的節點數，超過則回傳衝突最少的節點
+CBS_MAX_NODES = 200
+# 整個求解的時間上限 (秒)，超過則回傳衝突最少的節點
+CBS_TIME_LIMIT = 5.0
+# 低層每次搜索的時間上限 (秒)，超過視為此分支無路可走
+CBS_LOW_LEVEL_TIME = 1.0
+
+
+def _plan_low_level(task):
+    """
+    低層搜索 (在子行程中執行，參數與回傳值都必須可 pickle)
+    task: (ship_info, vertices, edges, interfering_paths, safe_distance, grid_scale,
+           planner_kwargs, time_limit)
+      vertices / edges: ConstraintTable 的頂點 / 邊約束
+      interfering_paths: 計入 FCC 的干擾船 ({"id", "path", "headings"})
+      time_limit: 搜索時間上限 (秒)，None 則不限
+    回傳 (路徑(公尺), 航向列表, analysis)；超過時間上限時路徑為空列表
+    """
+    (
+        ship_info,
+        vertices,
+        edges,
+        interfering_paths,
+        safe_distance,
+        grid_scale,
+        planner_kwargs,
+        time_limit,
+    ) = task
+    reservations = None
+    if vertices or edges:
+        reservations = ConstraintTable(vertices, edges)
+    cancel = None
+    if time_limit is not None:
+        cancel = CancellationToken(deadline=time.perf_counter() + time_limit)
+    planner = n_fcc_a(
+        ship_info=ship_info,
+        interfering_paths=list(interfering_paths),
+        grid_scale=grid_scale,
+        reservations=reservations,
+        **planner_kwargs,
+    )
+    path_m, headings = planner.calculate_path(cancel=cancel)
+    return path_m, headings, planner.analysis
+
+
+def _first_conflict(path_a, path_b, safe_distance):
+    """
+    兩條路徑最早發生衝突的時間步，沒有衝突回傳 None (判定同 paths_conflict)。
+    第 0 步為兩船目前位置，無法改變，不列入。
+    """
+    for step in range(1, max(len(path_a), len(path_b))):
+        pa = path_a[min(step, len(path_a) - 1)]
+        pb = path_b[min(step, len(path_b) - 1)]
+        if math.hypot(pa[0] - pb[0], pa[1] - pb[1]) < safe_distance:
+            return step
+    return None
+
+
+def _conflicts(solution, safe_distance):
+    """回傳 [(時間步, 船a, 船b), ...]：每對衝突船最早的衝突 (沒有路徑的船不比對)"""
+    planned = [(ship_id, plan[0]) for ship_id, plan in solution.items() if plan[0]]
+    found = []
+    for (id_a, path_a), (id_b, path_b) in itertools.combinations(planned, 2):
+        step = _first_conflict(path_a, path_b, safe_distance)
+        if step is not None:
+            found.append((step, id_a, id_b))
+    return found
+
+
+def _cost(solution):
+    """節點成本：各船路徑步數總和"""
+    return sum(len(plan[0]) for plan in solution.values())
+
+
+def _cell_at(path, step, grid_scale):
+    px, py = path[min(step, len(path) - 1)]
+    return int(round(px / grid_scale)), int(round(py / grid_scale))
+
+
+def _constraint(path, step, grid_scale):
+    """
+    禁止此船在時間步 step 照原路徑走的約束：
+    已停在終點時為頂點約束 ("vertex", (t, x, y))，否則為邊約束 ("edge", (t, x, y, nx, ny))
+    """
+    x, y = _cell_at(path, step, grid_scale)
+    if step >= len(path) - 1:
+        return "vertex", (step, x, y)
+    px, py = _cell_at(path, step - 1, grid_scale)
+    return "edge", (step, px, py, x, y)
+
+
+def cbs_solve(
+    ships,
+    safe_distance=1,
+    grid_scale=0.2,
+    planner_kwargs=None,
+    max_nodes=CBS_MAX_NODES,
+    time_limit=CBS_TIME_LIMIT,
+    low_level_time=CBS_LOW_LEVEL_TIME,
+    workers=None,
+    cancel=None,
+    executor=None,
+):
+    """
+    ships: [(船id, {"pos": (x, y), "goal": (gx, gy)}), ...] (單位：公尺)
+    planner_kwargs: 傳給低層 n_fcc_a 的參數 (須可 pickle)
+    max_nodes: 約束樹最多展開的節點數
+    time_limit: 求解時間上限 (秒)，None 則不限；在展開每個約束樹節點前檢查
+    low_level_time: 低層每次搜索的時間上限 (秒)，None 則不限；不超過 time_limit 剩餘的時間
+    workers: process pool 的行程數，None 為 CPU 核心數，<= 1 則在本行程依序執行
+    executor: 呼叫端保留的 ProcessPoolExecutor，給定時沿用它 (不另建、也不關閉)，忽略 workers。
+      每次呼叫都建立 process pool 要重新啟動子行程並載入模組，重複求解時應沿用同一個
+    cancel: CancellationToken，在展開每個約束樹節點前檢查；
+      被取消時與超過 max_nodes 相同，回傳衝突最少的節點，stats["cancelled"] 為 True
+
+    回傳 (solution, stats)：
+      solution: {船id: (路徑(公尺), 航向列表, analysis)}；找不到路徑的船路徑為空列表
+      stats: {"solved", "nodes_expanded", "nodes_generated", "low_level_calls", "conflicts",
+              "cancelled", "timed_out"}
+        產生出沒有衝突的節點 (含根節點) 即回傳它，solved 為 True，不必等它被取出
+        (不保證總步數最少)。
+        solved 為 False 時 (超過 max_nodes / time_limit 或被取消) 回傳的是已產生節點中
+        衝突最少者，conflicts 為其衝突船對數
+    """
+    if planner_kwargs is None:
+        planner_kwargs = {}
+    if workers is None:
+        workers = os.cpu_count() or 1
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    ship_infos = dict(ships)
+    ship_ids = [ship_id for ship_id, _ in ships]
+    stats = {
+        "solved": False,
+        "nodes_expanded": 0,
+        "nodes_generated": 0,
+        "low_level_calls": 0,
+        "conflicts": 0,
+        "cancelled": False,
+        "timed_out": False,
+    }
+
+    owns_executor = executor is None and workers > 1
+    if owns_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    def search_time():
+        """這次低層搜索可用的時間 (秒)"""
+        if deadline is None:
+            return low_level_time
+        remaining = max(deadline - time.perf_counter(), 0.0)
+        return remaining if low_level_time is None else min(low_level_time, remaining)
+
+    def task(node, ship_id, constraints, avoid):
+        solution = node["solution"] if node is not None else {}
+        interfering = tuple(
+            {"id": other_id, "path": solution[other_id][0], "headings": solution[other_id][1]}
+            for other_id in sorted(avoid)
+            if solution[other_id][0]
+        )
+        return (
+            ship_infos[ship_id],
+            tuple(sorted(constraints["vertex"])),
+            tuple(sorted(constraints["edge"])),
+            interfering,
+            safe_distance,
+            grid_scale,
+            planner_kwargs,
+            search_time(),
+        )
+
+    def run(tasks):
+        stats["low_level_calls"] += len(tasks)
+        if executor is None or len(tasks) == 1:
+            return [_plan_low_level(item) for item in tasks]
+        return list(executor.map(_plan_low_level, tasks))
+
+    no_constraints = {"vertex": frozenset(), "edge": frozenset()}
+    try:
+        root_plans = run(
+            [task(None, ship_id, no_constraints, ()) for ship_id in ship_ids]
+        )
+        root = {
+            "constraints": {ship_id: no_constraints for ship_id in ship_ids},
+            "avoid": {ship_id: frozenset() for ship_id in ship_ids},
+            "solution": dict(zip(ship_ids, root_plans)),
+        }
+        root["conflicts"] = _conflicts(root["solution"], safe_distance)
+
+        open_heap = []
+        counter = itertools.count()
+
+        def push(node):
+            stats["nodes_generated"] += 1
+            heapq.heappush(
+                open_heap,
+                (len(node["conflicts"]), _cost(node["solution"]), next(counter), node),
+            )
+
+        push(root)
+        best = root
+        stats["solved"] = not root["conflicts"]
+        while open_heap and not stats["solved"] and stats["nodes_expanded"] < max_nodes:
+            if cancel is not None and cancel.cancelled:
+                stats["cancelled"] = True
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                stats["timed_out"] = True
+                break
+            _, _, _, node = heapq.heappop(open_heap)
+            stats["nodes_expanded"] += 1
+
+            # 最早的衝突：兩艘船各自產生一個子節點，禁止它在該時間步照原路徑走，
+            # 並把另一艘船加入它的干擾船
+            step, id_a, id_b = min(node["conflicts"])
+            branches = []
+            for ship_id, other_id in ((id_a, id_b), (id_b, id_a)):
+                kind, item = _constraint(node["solution"][ship_id][0], step, grid_scale)
+                constraints = dict(node["constraints"][ship_id])
+                constraints[kind] = constraints[kind] | {item}
+                # 此節點中與它衝突的船都計入 FCC，一次讓開
+                avoid = node["avoid"][ship_id] | {
+                    b if a == ship_id else a
+                    for _, a, b in node["conflicts"]
+                    if ship_id in (a, b)
+                }
+                branches.append((ship_id, constraints, avoid))
+            plans = run(
+                [task(node, ship_id, constraints, avoid) for ship_id, constraints, avoid in branches]
+            )
+            for (ship_id, constraints, avoid), plan in zip(branches, plans):
+                if not plan[0]:
+                    # 此分支在約束下無路可走 (或超過低層時間上限)
+                    continue
+                child = {
+                    "constraints": {**node["constraints"], ship_id: constraints},
+                    "avoid": {**node["avoid"], ship_id: avoid},
+                    "solution": {**node["solution"], ship_id: plan},
+                }
+                child["conflicts"] = _conflicts(child["solution"], safe_distance)
+                push(child)
+                if len(child["conflicts"]) < len(best["conflicts"]):
+                    best = child
+                if not child["conflicts"]:
+                    # 產生時就已沒有衝突：直接回傳
+                    stats["solved"] = True
+                    break
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+    stats["conflicts"] = len(best["conflicts"])
+    return best["solution"], stats
@@ -5,26 +5,20 @@ import sys
 import math
 import heapq
 import random
+import numpy as np
 from pygame.locals import *
 from boat import *
 from My_FCC_Astar import *
 import config
 from other_object import *
-from ship_navigation_v1 import multi_ship_planning  # 多艘船規劃函式
-
-# -----------------------------------【新加入】 import threading
-import threading
-
-pygame.init()
+from planner_process import PlannerProcess  # 在獨立行程中執行多艘船規劃
+from ship_navigation_v1 import PATH_STORAGE_DTYPE, assign_ring_slots, split_replan
 
 # ------------------------------------ 參數設定 ----------------------------------------
 SCREEN_WIDTH = config.SCREEN_WIDTH
 SCREEN_HEIGHT = config.SCREEN_HEIGHT
 GRID_SIZE = config.GRID_SIZE
 
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Boat Navigation System")
-
 WHITE = config.WHITE
 BUTTON_COLOR = config.BUTTON_COLOR
 TEXT_COLOR = config.TEXT_COLOR
@@ -44,34 +38,21 @@ reset_button_rect = pygame.Rect(
     (reset_button_x, SCREEN_HEIGHT - BUTTON_HEIGHT * 1.5), (BUTTON_WIDTH, BUTTON_HEIGHT)
 )
 
-font_size = 25
-font = pygame.font.SysFont(None, font_size)
-
-# 【新加入】 全域變數：背景計算狀態
-planning_thread = None            # Thread物件 (或None)
-planning_thread_busy = False      # 是否正在後臺計算
-planning_results = None           # 暫存「背景計算完」的路徑規劃結果
+# 畫面座標 (像素) 與規劃座標 (公尺) 的比例
+CONVERT_SIZE = 25
+# 規劃結果的 (N, 4) 路徑陣列 (x, y, t, heading) 乘上此列即換成像素座標
+METERS_TO_PIXELS = np.array([CONVERT_SIZE, CONVERT_SIZE, 1, 1], dtype=np.float64)
+# 差分重算：新目標與路徑原本的目標相距不超過此值 (公尺) 的船沿用剩餘路徑
+REPLAN_GOAL_TOLERANCE = 0.5
+# 包圍圈目標分配：第一次計算時在 [0, 2π/N) 內試的旋轉角度數 (之後沿用選出的角度)
+RING_ROTATION_STEPS = 8
 
 # ------------------------------------ 船隻設定 (你原本的邏輯) ----------------------------------------
 MAX_SPEED = config.MAX_SPEED
 center = (SCREEN_WIDTH // 4, SCREEN_HEIGHT // 4)
 radius = 100
 num_boats = config.BOAT_NUM
-boats = []
-for i in range(num_boats):
-    if i % 2 == 1:
-        pos = (200 + (i // 2 + 1) * 70, 200 - (i // 2 + 1) * 70)
-    else:
-        pos = (200 - (i // 2) * 70, 200 - (i // 2) * 70)
-    boat = Boat(f"picture/boat{i}.png", pos, i + 1, MAX_SPEED)
-    boats.append(boat)
-
-enemy_id = config.ENEMY_ID
-enemy_boat = EnemyBoat(
-    "picture/enemy_boat.png", (SCREEN_WIDTH // 3 * 1, SCREEN_HEIGHT // 3 * 2), enemy_id
-)
 
-grid_map = GridMap(SCREEN_WIDTH, SCREEN_HEIGHT, GRID_SIZE)
 
 def load_and_scale_image(path, max_size):
     try:
@@ -82,10 +63,6 @@ def load_and_scale_image(path, max_size):
         print(f"Cannot load image {path}: {e}")
         sys.exit()
 
-background = load_and_scale_image("picture/sea.png", (SCREEN_WIDTH, SCREEN_HEIGHT))
-main_boat = boats[0]  # 假設第一艘船為主控
-other_boats = boats[1:]
-
 
 def draw_buttons(selecting_destination, current_boat, boats):
     pygame.draw.rect(screen, BUTTON_COLOR, start_button_rect)
@@ -104,88 +81,91 @@ def draw_grid(screen, color=(240, 240, 240)):
     for y in range(0, SCREEN_HEIGHT, GRID_SIZE):
         pygame.draw.line(screen, color, (0, y), (SCREEN_WIDTH, y))
 
-selecting_destination = False
-reading_sailing = False
-current_boat = 0
-priority_queue = []
-clock = pygame.time.Clock()
-running = True
-sailing = False
-routing = False
-mode = 0  # 0->初始, 1->駛向enemy, 2->進入勢力範圍
-enemy_boat_position1 = None
-f_enable = False
-first_recal = True # 是否第一次叫出mode2_recal
-finished = False
-
-# -----------------------------------【新加入】定義「背景規劃函式」-----------------------------------
-
-def background_multi_ship_planning(ships_info, smoothing_method="moving_average"):
-    """
-    此函式會在子執行緒中被呼叫：
-    1. 執行多船路徑規劃 (multi_ship_planning)
-    2. 計算完畢後，將結果儲存在全域變數 planning_results
-    """
-    global planning_results, planning_thread_busy, first_recal
-    try:
-        # 呼叫你在 ship_navigation_v1.py 中的多船規劃函式
-        result = multi_ship_planning(ships_info, smoothing_method=smoothing_method)
-        planning_results = result
-    except Exception as e:
-        print("[背景規劃錯誤]", e)
-        planning_results = None
-    finally:
-        # 結束後，把 busy 旗標關閉
-        planning_thread_busy = False
-        first_recal = False
-        print("[Background] multi_ship_planning 完成計算")
-
-# -----------------------------------【新加入】在 mode2_recal 中：用執行緒做計算-----------------------------------
+
+# -----------------------------------【新加入】在 mode2_recal 中：交給規劃行程計算-----------------------------------
 
 def mode2_recal():
-    global planning_thread, planning_thread_busy, planning_results, first_recal
+    global planning_results, pending_goals, ring_offset
 
-    # 如果還在算，就不要重複呼叫
-    if planning_thread_busy:
-        print("[mode2_recal] 仍在背景計算中，跳過本次呼叫")
-        return
-    
+    # 上一次還在算也直接送出：規劃行程以最新的請求為準，進行中的舊請求會被中止
 
-    # 這裡計算每艘船的新目標 (圍繞 enemy_boat.position)
+    # 這裡計算每艘船的新目標 (圍繞 enemy_boat.position)：
+    # 依各船 (規劃起點) 位置做最小距離指派，避免船為了照順序就位而互相穿越。
+    # 旋轉角度只在第一次計算時搜尋，之後沿用，目標才不會隨重算跳動
     target_circle_radius = enemy_boat.around_radius
-    N = len(boats)
-    for idx, boat in enumerate(boats):
-        theta = (2 * math.pi / N) * idx
-        new_goal = enemy_boat.position + Vector2(
-            target_circle_radius * math.cos(theta),
-            target_circle_radius * math.sin(theta),
-        )
-        boat.destination = new_goal
-        print(f"Boat {boat.id} 新目標: {new_goal}")
+    starts = [boat.position + boat.velocity * 50 if first_recal else boat.position for boat in boats]
+    goals, ring_offset = assign_ring_slots(
+        [(p.x, p.y) for p in starts],
+        (enemy_boat.position.x, enemy_boat.position.y),
+        target_circle_radius,
+        offset=0.0 if first_recal else ring_offset,
+        rotation_steps=RING_ROTATION_STEPS if first_recal else 1,
+    )
+    new_goals = {str(boat.id): Vector2(*goal) for boat, goal in zip(boats, goals.tolist())}
 
     # 整理 ships_info (公尺座標)
-    convert_size = 25
     ships_info = []
+    previous_plans = {}
+    for boat, position in zip(boats, starts):
+        bid = str(boat.id)
+        x_m  = position.x / CONVERT_SIZE
+        y_m  = position.y / CONVERT_SIZE
+        gx_m = new_goals[bid].x / CONVERT_SIZE
+        gy_m = new_goals[bid].y / CONVERT_SIZE
+        ships_info.append({"id": bid, "pos": (x_m, y_m), "goal": (gx_m, gy_m)})
+        # 還在沿路徑航行的船：剩餘路徑 (從上一個經過的中繼點開始)。
+        # 用規劃結果的 float64 公尺路徑判定衝突，不從 float32 的像素路徑換回
+        if not first_recal and bid in planned_paths and boat.is_moving and boat.path_index < len(boat.path):
+            previous_plans[bid] = {
+                "goal": path_goals[bid],
+                "path": planned_paths[bid][max(boat.path_index - 1, 0):],
+            }
+
+    # 差分重算：目標幾乎沒動、剩餘路徑也不互相衝突的船沿用原路徑，只重算其他船
+    fixed_paths, ships_info = split_replan(ships_info, previous_plans, REPLAN_GOAL_TOLERANCE)
     for boat in boats:
-        if boat.destination is None:
-            continue
-        position = boat.position
-        if first_recal:
-            position = boat.position + boat.velocity * 50
-        x_m  = position.x / convert_size
-        y_m  = position.y / convert_size
-        gx_m = boat.destination.x / convert_size
-        gy_m = boat.destination.y / convert_size
-        ships_info.append({"id": str(boat.id), "pos": (x_m, y_m), "goal": (gx_m, gy_m)})
-    # 用 Thread 在背景計算
-    planning_thread_busy = True
-    planning_results = None  # 清空舊結果
-    def do_planning():
-        background_multi_ship_planning(ships_info, "moving_average")
+        bid = str(boat.id)
+        if bid in fixed_paths:
+            boat.destination = Vector2(path_goals[bid]) * CONVERT_SIZE
+        else:
+            boat.destination = new_goals[bid]
+            print(f"Boat {boat.id} 新目標: {boat.destination}")
+    if not ships_info:
+        print("[mode2_recal] 所有船的目標都在容許範圍內，沿用原路徑")
+        return
 
-    planning_thread = threading.Thread(target=do_planning)
-    planning_thread.start()
-    print("[mode2_recal] 已啟動背景執行緒，開始算 multi_ship_planning...")
+    # 送到規劃行程計算 (不阻塞)
+    planning_results = None  # 清空舊結果
+    pending_goals = {ship["id"]: ship["goal"] for ship in ships_info}
+    enemy_m = (enemy_boat.position.x / CONVERT_SIZE, enemy_boat.position.y / CONVERT_SIZE)
+    request_id = planner_process.submit(ships_info, fixed_paths=fixed_paths, origin=enemy_m)
+    print(
+        f"[mode2_recal] 已送出規劃請求 #{request_id} (重算 {len(ships_info)} 艘，"
+        f"沿用 {len(fixed_paths)} 艘)，開始算 multi_ship_planning..."
+    )
+
+# -----------------------------------【新加入】每幀檢查規劃行程的結果-----------------------------------
+
+def poll_planner_process():
+    """取回規劃行程算好的最新結果，存入 planning_results"""
+    global planning_results, first_recal
+    if not planner_process.busy:
+        return
+    result = planner_process.poll()
+    if planner_process.busy:
+        return  # 還沒算好
+    if planner_process.error is not None:
+        print("[背景規劃錯誤]", planner_process.error)
+    planning_results = result
+    first_recal = False
+    print("[Background] multi_ship_planning 完成計算")
+    cache_stats = next(iter(result.values()))["analysis"].get("plan_cache") if result else None
+    if cache_stats is not None:
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        print(
+            f"[Background] 規劃快取{'命中' if cache_stats['hit'] else '未命中'}，"
+            f"命中率 {cache_stats['hits']}/{lookups}"
+        )
 
 # -----------------------------------【新加入】一個小函式：套用規劃結果到船隻-----------------------------------
 
@@ -198,181 +178,244 @@ def apply_planning_results_to_boats():
     if planning_results is None:
         return  # 還沒計算好或沒有結果
 
-    convert_size = 25
     for boat in boats:
         bid = str(boat.id)
         if bid in planning_results:
-            path_data = planning_results[bid]
-            path_meters = path_data["path"]
-            headings = path_data.get("headings", [])
-
-            # 組合你的 path 格式 (x, y, t, heading) (以像素為單位)
-            new_path = []
-            for i, (px_m, py_m) in enumerate(path_meters):
-                hdg = headings[i] if i < len(headings) else 0
-                px_cm = px_m * convert_size
-                py_cm = py_m * convert_size
-                new_path.append((px_cm, py_cm, 0, hdg))
-
-            boat.path = new_path
-            if boat.path:
-                # 讓船移動
-                boat.is_moving = True
-                boat.path_index = 1
+            path_meters = planning_results[bid]["path"]
+            if not len(path_meters):
+                # 這次規劃找不到路徑，沿用舊路徑
+                continue
+            # (N, 4) 路徑陣列 (x, y, t, heading)：x, y 由公尺換成像素，整批一次乘上；
+            # Boat.path 只用於移動與繪圖，存成 float32
+            boat.path = (path_meters * METERS_TO_PIXELS).astype(PATH_STORAGE_DTYPE)
+            planned_paths[bid] = path_meters
+            path_goals[bid] = pending_goals[bid]
+            # 讓船移動
+            boat.is_moving = True
+            boat.path_index = 1
 
     # 套用完把結果清空，避免重複套用
     planning_results = None
     print("[Main] 已把背景計算結果更新到所有船隻。")
 
-# ----------------------------------- 主要遊戲迴圈 -----------------------------------
-
-while running:
-    clock.tick(50)
-    sailing_counts = sum(1 for b in boats if b.is_moving)
-    sailing = sailing_counts > 0
 
-    # 更新障礙物
-    grid_map.set_obstacles_from_boats(boats, enemy_boat)
-
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            running = False
-            break
-        # # 傳遞鍵盤事件給 Controller 處理
-        # if mode == 0:
-        #     Controller.handle_event(main_boat, event)
-        if event.type == KEYDOWN:
-            if event.key in [K_UP, K_DOWN, K_LEFT, K_RIGHT]:
-                enemy_boat.handle_keydown(event.key)
-            elif event.key == K_f:
-                if not f_enable:
-                    f_enable = True
-                    print("開始航行 mode=1")
-                    for boat in boats:
-                        boat.destination = enemy_boat.position
-                        boat.speed = boat.base_speed
-                        boat.velocity = Vector2(math.cos(boat.angle), math.sin(boat.angle)) * boat.speed
-                        boat.mode1_sailing()
-                    main_boat = boats[0]
-                    for boat in boats:
-                        if boat.dest_dist < main_boat.dest_dist:
-                            main_boat = boat
-                    for boat in boats:
-                        if boat != main_boat:
-                            boat.velocity = main_boat.velocity
-                    mode = 1
-                else:
-                    f_enable = False
-                    planning_results = None
-                    for boat in boats:
-                        boat.boat_dock(boat.position)
-                    mode = 0
-                    # Controller.change_mode(0)
-            elif event.key == K_r:
-                print("重置所有船隻")
-                boats = []
-                for i in range(num_boats):
-                    angle = (2 * math.pi / num_boats) * i
-                    if i == 0:
-                        angle += math.radians(20)
-                    pos = (
-                        center[0] + radius * math.cos(angle),
-                        center[1] + radius * math.sin(angle),
-                    )
-                    boat = Boat(f"picture/boat{i}.png", pos, i + 1, MAX_SPEED)
-                    boats.append(boat)
-                print("所有船隻已重置")
-
-        elif event.type == KEYUP:
-            if event.key in [K_UP, K_DOWN, K_LEFT, K_RIGHT]:
-                enemy_boat.handle_keyup(event.key)
-
-    # ------------------ 模式切換及邏輯 ------------------
-    if mode == 0:
-        pass  # 尚未啟動
-
-    elif mode == 1:
-        # 領頭船
-        main_boat.mode1_sailing()
-        # 所有船與領頭船方向保持一致
-        for boat in boats:
-            boat.velocity = main_boat.velocity
-            boat.go_forward()
-        
-        first_recal = True
-        dist_to_enemy = (main_boat.position - enemy_boat.position).length()
-        if dist_to_enemy < enemy_boat.alg_radius:
-            print("Main boat 進入 enemy的大泡泡, 切到 mode=2")
-            enemy_boat_position1 = enemy_boat.position.copy()
-            mode2_recal()  # **這裡呼叫改成開執行緒做計算**
-            mode = 2
-
-    elif mode == 2:
-        # 如果敵船移動超過一定距離，就重算
-        if (enemy_boat.position - enemy_boat_position1).length() > enemy_boat.speed * 3:
-            print("敵船移動超過閾值，重新算")
-            enemy_boat_position1 = enemy_boat.position.copy()
-            mode2_recal()  # 再次呼叫執行緒
-
-        # 讓每艘船走自己的 path
-        if not first_recal:
-            for boat in boats:
-                boat.update2(boats, grid_map)
+# ----------------------------------- 主要遊戲迴圈 -----------------------------------
+# spawn 啟動的規劃行程會以 __mp_main__ 重新載入本模組，畫面、船隻與遊戲迴圈只在直接執行時建立
+if __name__ == "__main__":
+    pygame.init()
+
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Boat Navigation System")
+
+    font_size = 25
+    font = pygame.font.SysFont(None, font_size)
+
+    # 【新加入】 全域變數：背景計算狀態
+    # 規劃行程：各船的 IncrementalPlanner 保存在該行程中，多次規劃間沿用
+    # 不使用 DistanceField：敵船移動後目標格改變，每次重算都要重建距離表，實測比八方向距離慢
+    # bounded 模式：目標不可達時快速失敗，避免規劃行程卡住
+    # analysis="off"：遊戲迴圈不讀路徑分析 (逐步 FCC)，不計算也不傳回主行程
+    # plan_cache：相同的包圍情境 (相對敵船) 直接沿用存下的路徑，快取檔案跨次執行沿用
+    planner_process = PlannerProcess(
+        plan_cache={"path": "plan_cache.pkl"},
+        smoothing_method="moving_average",
+        planner_kwargs={"bounded": True, "analysis": "off"},
+    )
+    planning_results = None           # 暫存「背景計算完」的路徑規劃結果
+    pending_goals = {}                # 最新一次規劃請求中各船的目標 (公尺)
+    path_goals = {}                   # 各船目前路徑規劃時的目標 (公尺)，差分重算時比對
+    planned_paths = {}                # 各船目前的路徑 (公尺，float64)，差分重算時判定衝突
+    ring_offset = 0.0                 # 包圍圈目標選用的旋轉角度 (mode2_recal 更新)
+
+    boats = []
+    for i in range(num_boats):
+        if i % 2 == 1:
+            pos = (200 + (i // 2 + 1) * 70, 200 - (i // 2 + 1) * 70)
         else:
+            pos = (200 - (i // 2) * 70, 200 - (i // 2) * 70)
+        boat = Boat(f"picture/boat{i}.png", pos, i + 1, MAX_SPEED)
+        boats.append(boat)
+
+    enemy_id = config.ENEMY_ID
+    enemy_boat = EnemyBoat(
+        "picture/enemy_boat.png", (SCREEN_WIDTH // 3 * 1, SCREEN_HEIGHT // 3 * 2), enemy_id
+    )
+
+    grid_map = GridMap(SCREEN_WIDTH, SCREEN_HEIGHT, GRID_SIZE)
+
+    background = load_and_scale_image("picture/sea.png", (SCREEN_WIDTH, SCREEN_HEIGHT))
+    main_boat = boats[0]  # 假設第一艘船為主控
+    other_boats = boats[1:]
+
+    selecting_destination = False
+    reading_sailing = False
+    current_boat = 0
+    priority_queue = []
+    clock = pygame.time.Clock()
+    running = True
+    sailing = False
+    routing = False
+    mode = 0  # 0->初始, 1->駛向enemy, 2->進入勢力範圍
+    enemy_boat_position1 = None
+    f_enable = False
+    first_recal = True # 是否第一次叫出mode2_recal
+    finished = False
+
+    while running:
+        clock.tick(50)
+        sailing_counts = sum(1 for b in boats if b.is_moving)
+        sailing = sailing_counts > 0
+
+        # 更新障礙物
+        grid_map.set_obstacles_from_boats(boats, enemy_boat)
+
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                running = False
+                break
+            # # 傳遞鍵盤事件給 Controller 處理
+            # if mode == 0:
+            #     Controller.handle_event(main_boat, event)
+            if event.type == KEYDOWN:
+                if event.key in [K_UP, K_DOWN, K_LEFT, K_RIGHT]:
+                    enemy_boat.handle_keydown(event.key)
+                elif event.key == K_f:
+                    if not f_enable:
+                        f_enable = True
+                        print("開始航行 mode=1")
+                        for boat in boats:
+                            boat.destination = enemy_boat.position
+                            boat.speed = boat.base_speed
+                            boat.velocity = Vector2(math.cos(boat.angle), math.sin(boat.angle)) * boat.speed
+                            boat.mode1_sailing()
+                        main_boat = boats[0]
+                        for boat in boats:
+                            if boat.dest_dist < main_boat.dest_dist:
+                                main_boat = boat
+                        for boat in boats:
+                            if boat != main_boat:
+                                boat.velocity = main_boat.velocity
+                        mode = 1
+                    else:
+                        f_enable = False
+                        planning_results = None
+                        planner_process.reset()
+                        path_goals.clear()
+                        planned_paths.clear()
+                        for boat in boats:
+                            boat.boat_dock(boat.position)
+                        mode = 0
+                        # Controller.change_mode(0)
+                elif event.key == K_r:
+                    print("重置所有船隻")
+                    planner_process.reset()
+                    path_goals.clear()
+                    planned_paths.clear()
+                    boats = []
+                    for i in range(num_boats):
+                        angle = (2 * math.pi / num_boats) * i
+                        if i == 0:
+                            angle += math.radians(20)
+                        pos = (
+                            center[0] + radius * math.cos(angle),
+                            center[1] + radius * math.sin(angle),
+                        )
+                        boat = Boat(f"picture/boat{i}.png", pos, i + 1, MAX_SPEED)
+                        boats.append(boat)
+                    print("所有船隻已重置")
+
+            elif event.type == KEYUP:
+                if event.key in [K_UP, K_DOWN, K_LEFT, K_RIGHT]:
+                    enemy_boat.handle_keyup(event.key)
+
+        # ------------------ 模式切換及邏輯 ------------------
+        if mode == 0:
+            pass  # 尚未啟動
+
+        elif mode == 1:
+            # 領頭船
+            main_boat.mode1_sailing()
+            # 所有船與領頭船方向保持一致
             for boat in boats:
+                boat.velocity = main_boat.velocity
                 boat.go_forward()
         
-    not_moving_num = 0
-    for boat in boats:
-        if not boat.is_moving:
-            not_moving_num += 1
-    if not_moving_num == 5:
-        finished = False
-    else:
-        finised = True
-
-        # 如果都到目標了，可切回 mode=0 (或做其他事)
-        # if not_moving_num == num_boats:
-        #     mode = 0
-
-    # 【新加入】檢查背景計算結果並套用
-    apply_planning_results_to_boats()
-
-    # if mode == 0:
-    #     # 1) 更新主船
-    #     Controller.update_mainboat(main_boat, grid_map)
-    #     # 2) 其他船跟隨隊形
-    #     Controller.update_formation(main_boat, other_boats, grid_map)
-
-    # ---------------------------------------- 繪製畫面 ------------------------------------------
-    screen.blit(background, (0, 0))
-
-    # 繪製路徑(當 mode==2 時, 你想畫箭頭或其他)
-    if mode == 2 and not first_recal:
+            first_recal = True
+            dist_to_enemy = (main_boat.position - enemy_boat.position).length()
+            if dist_to_enemy < enemy_boat.alg_radius:
+                print("Main boat 進入 enemy的大泡泡, 切到 mode=2")
+                enemy_boat_position1 = enemy_boat.position.copy()
+                mode2_recal()  # **這裡呼叫改成開執行緒做計算**
+                mode = 2
+
+        elif mode == 2:
+            # 如果敵船移動超過一定距離，就重算
+            if (enemy_boat.position - enemy_boat_position1).length() > enemy_boat.speed * 3:
+                print("敵船移動超過閾值，重新算")
+                enemy_boat_position1 = enemy_boat.position.copy()
+                mode2_recal()  # 再次呼叫執行緒
+
+            # 讓每艘船走自己的 path
+            if not first_recal:
+                for boat in boats:
+                    boat.update2(boats, grid_map)
+            else:
+                for boat in boats:
+                    boat.go_forward()
+        
+        not_moving_num = 0
         for boat in boats:
-            if boat.is_moving:
-                for px, py, step_t, hdg in boat.path:
-                    draw_arrow(screen, (255, 0, 0), (px, py), -hdg, size=8)
+            if not boat.is_moving:
+                not_moving_num += 1
+        if not_moving_num == 5:
+            finished = False
+        else:
+            finised = True
+
+            # 如果都到目標了，可切回 mode=0 (或做其他事)
+            # if not_moving_num == num_boats:
+            #     mode = 0
+
+        # 【新加入】檢查背景計算結果並套用
+        poll_planner_process()
+        apply_planning_results_to_boats()
+
+        # if mode == 0:
+        #     # 1) 更新主船
+        #     Controller.update_mainboat(main_boat, grid_map)
+        #     # 2) 其他船跟隨隊形
+        #     Controller.update_formation(main_boat, other_boats, grid_map)
+
+        # ---------------------------------------- 繪製畫面 ------------------------------------------
+        screen.blit(background, (0, 0))
+
+        # 繪製路徑(當 mode==2 時, 你想畫箭頭或其他)
+        if mode == 2 and not first_recal:
+            for boat in boats:
+                if boat.is_moving:
+                    for px, py, step_t, hdg in boat.path.tolist():
+                        draw_arrow(screen, (255, 0, 0), (px, py), -hdg, size=8)
 
-    draw_grid(screen)
+        draw_grid(screen)
 
-    for b in boats:
-        b.draw(screen, font)
+        for b in boats:
+            b.draw(screen, font)
 
-    # 繪製障礙物網格
-    for col in range(grid_map.cols):
-        for row in range(grid_map.rows):
-            if grid_map.grid[col][row] != 0 and grid_map.grid[col][row] != enemy_boat.id:
-                px, py = grid_map.get_pixel_coords(col, row)
-                pygame.draw.circle(screen, (255, 165, 0), (px, py), 2)
+        # 繪製障礙物網格
+        for col in range(grid_map.cols):
+            for row in range(grid_map.rows):
+                if grid_map.grid[col][row] != 0 and grid_map.grid[col][row] != enemy_boat.id:
+                    px, py = grid_map.get_pixel_coords(col, row)
+                    pygame.draw.circle(screen, (255, 165, 0), (px, py), 2)
 
-    enemy_boat.update(grid_map)
-    enemy_boat.draw(screen, font)
+        enemy_boat.update(grid_map)
+        enemy_boat.draw(screen, font)
 
-    # if not sailing:
-    #     draw_buttons(selecting_destination, current_boat, boats)
+        # if not sailing:
+        #     draw_buttons(selecting_destination, current_boat, boats)
 
-    pygame.display.flip()
+        pygame.display.flip()
 
-pygame.quit()
-sys.exit()
+    planner_process.close()
+    pygame.quit()
+    sys.exit()
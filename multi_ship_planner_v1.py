@@ -2,6 +2,12 @@
 
 import math
 import heapq
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from open_list import OPEN_LISTS, make_open_list
 
 # =============================
 # 原始 GOODWIN 模型參數 (單位：公尺)
@@ -10,6 +16,343 @@ SECTER_RADIUS_LEFT = 0.7 * 0.95
 SECTER_RADIUS_RIGHT = 0.85 * 0.95
 SECTER_RADIUS_BACK = 0.45 * 0.95
 
+# =============================
+# 搜索狀態的整數編碼
+# =============================
+# 八方向移動，索引即為 3-bit 方向碼 = 航向 / 45° (正北為 0，順時針增加)
+DIRECTIONS = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+# 各方向碼對應的航向(度)，與 math.degrees(math.atan2(dx, dy)) % 360 完全相同
+DIRECTION_HEADINGS = [code * 45.0 for code in range(len(DIRECTIONS))]
+DIRECTION_BITS = 3
+# 狀態 = (x, y, t, 目前方向碼, 最近 k 步方向碼) 打包成一個 int：
+#   [ x - min_x | y - min_y | t | 目前方向碼 | 方向碼(舊 -> 新) ]
+# x, y 以搜索區域左下角為原點，再加上 COORD_OFFSET 讓非 bounded 模式跑出區域時仍為正數。
+# 目前方向碼與最新一步重複存放，使 f 值相同時整數 key 的大小順序
+# 與舊版 (x, y, t, heading, history) tuple 的比較順序一致，搜索結果不變。
+COORD_BITS = 16
+COORD_OFFSET = 1 << (COORD_BITS - 1)
+COORD_MASK = (1 << COORD_BITS) - 1
+STEP_BITS = 20
+STEP_MASK = (1 << STEP_BITS) - 1
+
+
+def _heading_diff(h1, h2):
+    """兩航向的夾角 (0 ~ 180 度)"""
+    return abs((h1 - h2 + 180) % 360 - 180)
+
+
+# 轉向限制查表：新方向與航向歷史中任一航向相差 >= 90° 即不可走。
+# DIRECTION_COMPAT[a]：方向碼 a 之後仍可走的方向碼 (8-bit 遮罩，第 b 位代表方向碼 b)
+DIRECTION_COMPAT = [
+    sum(1 << b for b, h_b in enumerate(DIRECTION_HEADINGS) if _heading_diff(h_b, h_a) < 90)
+    for h_a in DIRECTION_HEADINGS
+]
+# 8-bit 遮罩 -> 其中的方向碼 (由小到大，與逐一檢查 DIRECTIONS 的順序相同)
+MASK_CODES = [
+    tuple(code for code in range(len(DIRECTIONS)) if (mask >> code) & 1)
+    for mask in range(1 << len(DIRECTIONS))
+]
+
+
+def heading_mask(heading):
+    """與任意航向 heading (度) 相差 < 90° 的方向碼遮罩，用於起始航向"""
+    return sum(
+        1 << code for code, h in enumerate(DIRECTION_HEADINGS) if _heading_diff(h, heading) < 90
+    )
+
+
+@lru_cache(maxsize=None)
+def successor_masks(history_length):
+    """
+    回傳 tables，tables[n][codes] 為「最近 n 步方向碼為 codes (打包方式同狀態編碼，舊 -> 新)」
+    時下一步可走的方向碼遮罩，即各步 DIRECTION_COMPAT 的交集。n = 0..history_length
+    """
+    tables = [[(1 << len(DIRECTIONS)) - 1]]
+    for _ in range(history_length):
+        prev = tables[-1]
+        tables.append(
+            [
+                prev[codes >> DIRECTION_BITS] & DIRECTION_COMPAT[codes & 0b111]
+                for codes in range(len(prev) << DIRECTION_BITS)
+            ]
+        )
+    return tables
+
+# FCC 計入 A* 的方式 ("edge" 為實驗性，展開數遠多於 "heuristic"，見 n_fcc_a)
+FCC_MODES = ("heuristic", "edge")
+# calculate_path 之後的路徑分析 (逐步位置 / 航向 / FCC)：不做、第一次讀取時才算、立即算
+ANALYSIS_MODES = ("off", "lazy", "eager")
+# 路徑分析算出的欄位 (analysis="lazy" 時延後計算)
+ANALYSIS_KEYS = ("steps", "positions", "headings", "fcc")
+
+# 有 deadline 時的 anytime weighted A* (ARA*)：由大到小的啟發式權重
+ANYTIME_WEIGHTS = (2.5, 2.0, 1.5, 1.2, 1.0)
+# 每展開幾個節點檢查一次是否超過 deadline / 是否被取消
+DEADLINE_CHECK_INTERVAL = 64
+
+# 單艘干擾船 FCC 的下界：u_dist >= 0，u_theta 在 cos(...) = -1 時最小
+FCC_LOWER_BOUND = 0.5 * (17 / 44) * (-1 + math.sqrt(440 / 289 + 1))
+
+
+class DistanceField:
+    """
+    以反向 Dijkstra 算出的「到目標距離」表 (網格單位)，取代八方向距離作為啟發式。
+
+    狀態為 (方向碼, x, y)：船以該方向抵達 (x, y) 後，到 goal 的最短距離。
+    每步只允許與目前航向相差 < 90° 的方向 (即 ±45° 以內)，
+    是 n_fcc_a 航向歷史規則的放寬版，故距離仍為下界，且比八方向距離緊。
+    搜索區域外的格子不可經過 (與 bounded 模式一致)，走不到目標的狀態為 inf。
+    非 bounded 的搜索可繞出區域，本表會高估距離 (不 admissible)，n_fcc_a 只在 bounded 模式使用。
+
+    參數：
+      goal: 目標格座標 (gx, gy)
+      min_x, max_x, min_y, max_y: 計算範圍 (格座標，含邊界)
+    """
+
+    def __init__(self, goal, min_x, max_x, min_y, max_y):
+        self.goal = (goal[0], goal[1])
+        self.min_x = min_x
+        self.max_x = max_x
+        self.min_y = min_y
+        self.max_y = max_y
+        self.table = self._backward_dijkstra()
+
+    def _backward_dijkstra(self):
+        # 移動成本只有 1 與 √2，以 NumPy 做 Bellman-Ford 式的整張表鬆弛直到收斂，
+        # 結果與逐點 Dijkstra 相同，但每輪都是陣列運算
+        n_x = self.max_x - self.min_x + 1
+        n_y = self.max_y - self.min_y + 1
+        gx = self.goal[0] - self.min_x
+        gy = self.goal[1] - self.min_y
+
+        dist = np.full((len(DIRECTIONS), n_x, n_y), np.inf)
+        dist[:, gx, gy] = 0.0
+        while True:
+            # arrive[c, x, y]：從 (x, y) 朝方向 c 走一步後到目標的距離
+            arrive = np.full_like(dist, np.inf)
+            for code, (dx, dy) in enumerate(DIRECTIONS):
+                step_cost = math.sqrt(2) if (dx != 0 and dy != 0) else 1
+                dst_x = slice(max(0, -dx), n_x - max(0, dx))
+                src_x = slice(max(0, dx), n_x + min(0, dx))
+                dst_y = slice(max(0, -dy), n_y - max(0, dy))
+                src_y = slice(max(0, dy), n_y + min(0, dy))
+                arrive[code, dst_x, dst_y] = dist[code, src_x, src_y] + step_cost
+            # 目前方向碼 c 只能接 c-1, c, c+1
+            new_dist = np.minimum(
+                arrive, np.minimum(np.roll(arrive, 1, axis=0), np.roll(arrive, -1, axis=0))
+            )
+            new_dist[:, gx, gy] = 0.0
+            if np.array_equal(new_dist, dist):
+                return dist
+            dist = new_dist
+
+    def covers(self, goal, min_x, max_x, min_y, max_y):
+        """目標格相同，且本表範圍包含指定區域時可直接沿用"""
+        return (
+            (goal[0], goal[1]) == self.goal
+            and self.min_x <= min_x
+            and max_x <= self.max_x
+            and self.min_y <= min_y
+            and max_y <= self.max_y
+        )
+
+    def distance(self, x, y, code):
+        """以方向 code 抵達 (x, y) 後到目標的距離；超出範圍回傳 None"""
+        ix = x - self.min_x
+        iy = y - self.min_y
+        if 0 <= ix <= self.max_x - self.min_x and 0 <= iy <= self.max_y - self.min_y:
+            return self.table.item(code, ix, iy)
+        return None
+
+
+class CancellationToken:
+    """
+    規劃的取消旗標，傳給 n_fcc_a.calculate_path(cancel=...) 或 multi_ship_planning(cancel=...)。
+    搜索每展開 DEADLINE_CHECK_INTERVAL 個節點檢查一次 cancelled，
+    為 True 時立即結束並回傳空路徑，search_stats["cancelled"] 為 True，其餘統計為中止當下的值。
+
+    與 calculate_path(deadline=...) 不同：該 deadline 到期時 ARA* 回傳目前最好的路徑；
+    這裡的 deadline 到期視同取消，不回傳路徑。
+
+    參數：
+      deadline: time.perf_counter() 的絕對時間點，超過即視為已取消；None 表示不限時間
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._cancelled = False
+
+    def cancel(self):
+        """要求中止 (可由其他執行緒呼叫)"""
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        if not self._cancelled and self.deadline is not None:
+            self._cancelled = time.perf_counter() >= self.deadline
+        return self._cancelled
+
+
+class LazyAnalysis(dict):
+    """
+    analysis="lazy" 時的 n_fcc_a.analysis。
+    搜索統計 (search_stats、fcc_cache、anytime) 立即放入；steps / positions / headings / fcc
+    在第一次讀取這些欄位 (取值、get、in) 或走訪整個 dict 時才由 compute() 算出，之後沿用；
+    讀取其他欄位不會觸發計算。
+    pickle (例如傳回主行程) 時先算好，轉成一般 dict
+    """
+
+    def __init__(self, data, compute):
+        super().__init__(data)
+        self._compute = compute
+
+    def _materialize(self):
+        if self._compute is not None:
+            compute, self._compute = self._compute, None
+            dict.update(self, compute())
+
+    def __missing__(self, key):
+        if self._compute is None or key not in ANALYSIS_KEYS:
+            raise KeyError(key)
+        self._materialize()
+        return self[key]
+
+    def get(self, key, default=None):
+        if key in ANALYSIS_KEYS and not dict.__contains__(self, key):
+            self._materialize()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        if key in ANALYSIS_KEYS and not dict.__contains__(self, key):
+            self._materialize()
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self._materialize()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._materialize()
+        return dict.__len__(self)
+
+    def keys(self):
+        self._materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self._materialize()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize()
+        return dict.items(self)
+
+    def __repr__(self):
+        self._materialize()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        self._materialize()
+        return (dict, (list(dict.items(self)),))
+
+
+class ReservationTable:
+    """
+    時空預約表 (cooperative A*)：記錄已確定路徑的船在每個時間步佔用的格子，
+    n_fcc_a 以 reservations=... 查詢，直接捨棄會與這些船衝突的節點，不必衝突後重算。
+
+    船在時間步 t 位於 (x, y) 時，與 (x, y) 距離 < safe_distance 的格子在 t 都被預約，
+    與 paths_conflict 對格點路徑的判定相同。距離恰好等於 safe_distance 的格子也一併預約：
+    paths_conflict 以公尺座標相減，浮點誤差可能使其略小於 safe_distance 而判為衝突。
+    船走完路徑後停在終點 (同 get_position_at_step)，終點附近的格子自最後一步起永遠被預約。
+
+    參數：
+      safe_distance: 安全距離 (公尺)
+      grid_scale: 每格代表幾公尺，須與 n_fcc_a 相同
+    """
+
+    def __init__(self, safe_distance, grid_scale):
+        self.safe_distance = safe_distance
+        self.grid_scale = grid_scale
+        r = int(math.ceil(safe_distance / grid_scale))
+        self.offsets = [
+            (dx, dy)
+            for dx in range(-r, r + 1)
+            for dy in range(-r, r + 1)
+            if math.hypot(dx, dy) * grid_scale <= safe_distance + 1e-9
+        ]
+        self._cells = set()  # {(t, x, y)}
+        self._last_step = {}  # {(x, y): 在 _cells 中被預約的最後一個時間步}
+        self._parked = {}  # {(x, y): 自此時間步起永遠被預約}
+        self.num_paths = 0
+
+    def reserve_path(self, path):
+        """預約一條已確定的路徑 (公尺座標，每步一格，同 n_fcc_a.calculate_path() 的回傳值)"""
+        grid_path = [
+            (int(round(px / self.grid_scale)), int(round(py / self.grid_scale)))
+            for px, py in path
+        ]
+        last = len(grid_path) - 1
+        for t, (x, y) in enumerate(grid_path[:-1]):
+            for dx, dy in self.offsets:
+                cell = (x + dx, y + dy)
+                self._cells.add((t, cell[0], cell[1]))
+                if self._last_step.get(cell, -1) < t:
+                    self._last_step[cell] = t
+        x, y = grid_path[-1]
+        for dx, dy in self.offsets:
+            cell = (x + dx, y + dy)
+            if self._parked.get(cell, math.inf) > last:
+                self._parked[cell] = last
+        self.num_paths += 1
+
+    def is_reserved(self, x, y, t):
+        """格子 (x, y) 在時間步 t 是否已被預約"""
+        return (t, x, y) in self._cells or self._parked.get((x, y), math.inf) <= t
+
+    def blocks_move(self, x, y, nx, ny, t):
+        """時間步 t 由 (x, y) 移到 (nx, ny) 是否不可行 (目的格已被預約)"""
+        return self.is_reserved(nx, ny, t)
+
+    def is_parked(self, x, y):
+        """格子 (x, y) 是否在某個時間步之後永遠被預約 (在其他船終點附近)"""
+        return (x, y) in self._parked
+
+    def free_from(self, x, y, t):
+        """格子 (x, y) 自時間步 t 起是否都沒有預約 (規劃船抵達終點後會停在該處)"""
+        return (x, y) not in self._parked and self._last_step.get((x, y), -1) < t
+
+
+class ConstraintTable:
+    """
+    CBS 低層搜索的約束，介面同 ReservationTable (n_fcc_a 以 reservations=... 查詢)。
+    約束只針對單一時間步，不含 safe_distance 範圍：
+      - 頂點約束 (t, x, y)：時間步 t 不可位於格子 (x, y)
+      - 邊約束 (t, x, y, nx, ny)：時間步 t 不可由 (x, y) 移到 (nx, ny)
+    船抵達終點後停在該處，終點格之後仍有頂點約束時不算抵達目標。
+    """
+
+    def __init__(self, vertices=(), edges=()):
+        self._vertices = set(vertices)
+        self._edges = set(edges)
+        self._last_step = {}  # {(x, y): 該格最後一個頂點約束的時間步}
+        for t, x, y in self._vertices:
+            if self._last_step.get((x, y), -1) < t:
+                self._last_step[(x, y)] = t
+
+    def is_reserved(self, x, y, t):
+        return (t, x, y) in self._vertices
+
+    def blocks_move(self, x, y, nx, ny, t):
+        return (t, nx, ny) in self._vertices or (t, x, y, nx, ny) in self._edges
+
+    def is_parked(self, x, y):
+        return False
+
+    def free_from(self, x, y, t):
+        return self._last_step.get((x, y), -1) < t
+
+
 class n_fcc_a:
     """
     n_fcc_a 路徑規劃類別 (多干擾船版本)
@@ -24,14 +367,88 @@ class n_fcc_a:
            "headings": [h0, h1, ...]     # 與 path 對應的航向(度)，務必給
          }
       grid_scale: 每格代表幾公尺 (例如 grid_scale=0.5 -> 一格=0.5m)
+      fcc_memo: 是否以 dict 記住每個算過的 (t, x, y) 的 FCC (規劃器存在期間有效)。
+         同一格同一時間步會因航向歷史不同而出現多個狀態，每格每步只需算一次。
+         搜索只會用到搜索區域中一小部分的格子，只記住用到的格子比預先算好整個
+         (t, x, y) 成本體積快 (見 benchmark.py fcc_cache)。
+         記憶的命中與未命中次數放在 analysis["fcc_cache"]
+      bounded: 是否限制搜索範圍：超出 min_x..max_x / min_y..max_y 的節點直接捨棄，
+         且時間步 t 不得超過 max_steps；目標不可達時會很快回傳空路徑
+      max_steps: bounded 模式下的時間步上限，None 則依搜索區域大小自動決定
+      fcc_mode: FCC 計入 A* 的方式
+         - "heuristic"：原做法，FCC 加在啟發式上 (不 admissible / consistent，節點會被重複推入)
+         - "edge" (實驗性，較慢)：FCC 計入每一步的移動成本，啟發式只用八方向距離加上
+           「剩餘步數 x 每步 FCC 下界」，為 consistent，每個狀態最多展開一次。
+           但此下界遠小於實際的 FCC，A* 幾乎是均勻展開：展開數為 "heuristic" 的 3 ~ 15 倍
+           (benchmark.py fcc_modes：encirclement 約 58k -> 194k、demo 約 31k -> 474k)，
+           耗時也跟著增加。只用於需要 FCC 計入路徑成本的離線比較，即時規劃請用 "heuristic"
+      use_distance_field: 是否以 DistanceField (反向 Dijkstra、考慮轉向限制)
+         取代 h_cost_distance 作為啟發式中的距離項。只在 bounded 模式有效：
+         距離表把搜索區域外視為不可經過，非 bounded 的路徑可繞出區域，距離表會高估而使路徑
+         不再最佳，因此 bounded=False 時忽略此參數 (self.use_distance_field 為 False)
+      distance_field: 可沿用的 DistanceField (例如上一次規劃同一目標時建立的)，
+         若目標格不同或範圍不足，calculate_path() 會重建；結果存於 self.distance_field
+      anytime_weights: calculate_path(deadline=...) 時 ARA* 依序使用的啟發式權重，
+         最後一個通常為 1.0
+      keep_search_tree: 搜索結束後是否把搜索樹 (g_cost, parent, closed, open) 留在
+         self.search_tree，供 IncrementalPlanner 下次重算時修補沿用
+      reservations: ReservationTable，給定時捨棄被預約的 (x, y, t) 節點，
+         且只有在終點格之後不再被預約時才算抵達目標 (cooperative A*)；
+         CBS 的低層搜索改給 ConstraintTable (單一時間步的頂點 / 邊約束)
+      open_list: A* 的 OPEN 串列，"heap" (heapq)，也可給無參數即可建立 OPEN 串列的類別，
+         見 open_list.py
+      analysis: 搜索後的路徑分析 (analysis 中的 steps / positions / headings / fcc，
+         需對每艘干擾船逐步計算 FCC)，calculate_path(analysis=...) 可逐次覆寫
+         - "eager"：每次搜索後立即計算 (原做法)
+         - "lazy"：第一次讀取上述欄位時才計算 (見 LazyAnalysis)
+         - "off"：不計算，analysis 只有搜索統計；即時重算時用
+
+    搜索統計存於 self.search_stats (展開數、推入數等，皆為可加總的數值)，並一併放入 analysis；
+    有 deadline (ARA*) 時的權重與次佳上界另存於 self.anytime_stats (analysis["anytime"])。
 
     在 calculate_path() 回傳：
       - 規劃船的路徑(公尺座標列表)
       - 規劃船每步的航向(headings)列表
     """
 
-    def __init__(self, ship_info, interfering_paths, grid_scale=0.1):
+    def __init__(
+        self,
+        ship_info,
+        interfering_paths,
+        grid_scale=0.1,
+        fcc_memo=True,
+        bounded=False,
+        max_steps=None,
+        fcc_mode="heuristic",
+        use_distance_field=False,
+        distance_field=None,
+        anytime_weights=ANYTIME_WEIGHTS,
+        keep_search_tree=False,
+        open_list="heap",
+        reservations=None,
+        analysis="eager",
+    ):
+        if fcc_mode not in FCC_MODES:
+            raise ValueError(f"fcc_mode 必須是 {FCC_MODES} 之一，收到 {fcc_mode!r}")
+        if analysis not in ANALYSIS_MODES:
+            raise ValueError(f"analysis 必須是 {ANALYSIS_MODES} 之一，收到 {analysis!r}")
+        if not callable(open_list) and open_list not in OPEN_LISTS:
+            raise ValueError(
+                f"open_list 必須是 {tuple(OPEN_LISTS)} 之一，收到 {open_list!r}"
+            )
+        self.open_list = open_list
+        self.reservations = reservations
+        self.analysis_mode = analysis
+        self.fcc_mode = fcc_mode
         self.grid_scale = grid_scale
+        self.fcc_memo = fcc_memo
+        self.bounded = bounded
+        # 距離表只涵蓋搜索區域，非 bounded 時不 admissible，不使用
+        self.use_distance_field = use_distance_field and bounded
+        self.anytime_weights = tuple(anytime_weights)
+        self.keep_search_tree = keep_search_tree
+        self.search_tree = None
+        self.distance_field = distance_field if self.use_distance_field else None
 
         # 簡易函式：從 pos 到 goal 計算初始航向
         def compute_heading(pos, goal):
@@ -53,22 +470,7 @@ class n_fcc_a:
 
         # 2) 讀入所有干擾船的 path 與 heading，並轉成「格」座標
         #    interfering_paths 其實是 array of dict
-        self.interfering_paths = []
-        for ip in interfering_paths:
-            grid_path = []
-            for px, py in ip["path"]:
-                gx = int(round(px / grid_scale))
-                gy = int(round(py / grid_scale))
-                grid_path.append((gx, gy))
-
-            # 以防 headings 與 path 長度不一致可加檢查 (此處略)
-            # headings 直接保留原角度即可。
-            self.interfering_paths.append(
-                {
-                    "grid_path": grid_path,
-                    "headings": ip["headings"],
-                }
-            )
+        self.interfering_paths = [self._to_grid_path(ip) for ip in interfering_paths]
 
         # GOODWIN 模型參數換算為「格」單位
         self.g_secter_radius_left = SECTER_RADIUS_LEFT / grid_scale
@@ -90,9 +492,54 @@ class n_fcc_a:
         # 同樣根據 grid_scale 設定 FCC_Scale
         self.fcc_scale = 10 * (grid_scale / 0.1)
         self.heading_history_length = 4  # 可調參數
+        # 狀態編碼中保留最近 heading_history_length 步的方向碼
+        self._code_bits = DIRECTION_BITS * self.heading_history_length
+        self._code_mask = (1 << self._code_bits) - 1
+        self._state_bits = self._code_bits + DIRECTION_BITS
+        # 鄰居產生用的查表：可走方向遮罩、起始航向可走的方向，
+        # 以及各方向在 key >> _state_bits (= x | y | t) 上的增量與新的目前方向碼欄位
+        self._successor_masks = successor_masks(self.heading_history_length)
+        self._start_mask = heading_mask(self.yield_heading)
+        self._step_deltas = [
+            (dx << (COORD_BITS + STEP_BITS)) + (dy << STEP_BITS) + 1
+            for dx, dy in DIRECTIONS
+        ]
+        self._code_fields = [code << self._code_bits for code in range(len(DIRECTIONS))]
+
+        # 3) 定義 A* 搜索區域 (與干擾船相關的設定都在 _update_interference 中計算)
+        self._max_steps_arg = max_steps
+        self._update_interference()
+
+        # 逐點 FCC 的記憶表 {(t, x, y): fcc}，在規劃器存在期間有效。
+        # 干擾船走完路徑後停在最後一格，t 超過最長路徑時 FCC 不再變化，記憶時一併截斷。
+        # _fcc_partial 記錄 {(t, x, y): (未乘 fcc_scale 的 FCC 總和, 已加總的干擾船數)}，
+        # 追加干擾船時只需再加上新干擾船的部分
+        self._fcc_memo_table = {} if fcc_memo else None
+        self._fcc_partial = {}
+        self.fcc_cache_stats = {"hits": 0, "misses": 0}
+        # add_interfering_paths(warm_start=True) 留給下一次 calculate_path 的搜索樹
+        self._warm_start_tree = None
 
-        # 3) 定義 A* 搜索區域
-        #    包含：yield 船起點、終點，再把所有干擾船走過的點都考慮進去，最後加上一些 margin
+        # 內部分析用
+        self.analysis = {}
+        self.search_stats = {}
+        self.anytime_stats = None
+
+    def _to_grid_path(self, ip):
+        """把一艘干擾船的 {"path"(公尺), "headings"} 轉成 {"grid_path"(格), "headings"}"""
+        grid_path = []
+        for px, py in ip["path"]:
+            gx = int(round(px / self.grid_scale))
+            gy = int(round(py / self.grid_scale))
+            grid_path.append((gx, gy))
+
+        # 以防 headings 與 path 長度不一致可加檢查 (此處略)
+        # headings 直接保留原角度即可。
+        return {"grid_path": grid_path, "headings": ip["headings"]}
+
+    def _update_interference(self):
+        """依目前的干擾船重新計算搜索區域、步數上限與 FCC 相關常數"""
+        # 包含：yield 船起點、終點，再把所有干擾船走過的點都考慮進去，最後加上一些 margin
         xs = [self.yield_pos[0], self.yield_goal[0]]
         ys = [self.yield_pos[1], self.yield_goal[1]]
         for ip in self.interfering_paths:
@@ -106,18 +553,75 @@ class n_fcc_a:
         self.min_y = min(ys) - margin
         self.max_y = max(ys) + margin
 
-        # 內部分析用
-        self.analysis = {}
+        # bounded 模式的時間步上限：預設為搜索區域周長，足以沿邊界繞行一圈
+        max_steps = self._max_steps_arg
+        if max_steps is None:
+            max_steps = 2 * ((self.max_x - self.min_x) + (self.max_y - self.min_y))
+        self.max_steps = max_steps
+
+        # fcc_mode="edge" 時每一步 FCC 成本的下界
+        self._fcc_step_lower_bound = (
+            self.fcc_scale * FCC_LOWER_BOUND * len(self.interfering_paths)
+        )
+        self._fcc_last_step = max(
+            [len(ip["grid_path"]) - 1 for ip in self.interfering_paths], default=0
+        )
+
+    def add_interfering_paths(self, interfering_paths, warm_start=False):
+        """
+        追加干擾船後重算用 (格式同建構子的 interfering_paths)，不必重建規劃器：
+          - 已轉換的干擾船格座標、距離表照舊沿用
+          - FCC 記憶表只需再加上新干擾船的部分 (加總順序不變，結果與重建規劃器相同)
+          - 搜索區域只有在新路徑超出時才會變大
+        warm_start: 下一次 calculate_path 是否從上一次的搜索樹繼續 (需 keep_search_tree=True)。
+          只在 fcc_mode="heuristic" 時有效：此模式的 g 只有距離、與干擾船無關，
+          搜索樹仍然成立，只需以新的啟發式重算 OPEN 的 f；但已展開的節點不會重新展開，
+          路徑可能與重新搜索不同。
+          搜索區域變大時，狀態編碼的原點跟著平移；bounded 模式下舊區域邊界剪掉的節點
+          無法補回，此時不沿用。
+        """
+        old_box = (self.min_x, self.max_x, self.min_y, self.max_y)
+        self.interfering_paths.extend(self._to_grid_path(ip) for ip in interfering_paths)
+        self._update_interference()
+        if self._fcc_memo_table is not None:
+            self._fcc_memo_table = {}
+
+        self._warm_start_tree = None
+        new_box = (self.min_x, self.max_x, self.min_y, self.max_y)
+        if (
+            warm_start
+            and self.fcc_mode == "heuristic"
+            and self.search_tree is not None
+            and (not self.bounded or old_box == new_box)
+        ):
+            self._warm_start_tree = self._rebase_search_tree(
+                self.search_tree, old_box[0], old_box[2]
+            )
+        self.search_tree = None
+
+    def _rebase_search_tree(self, tree, old_min_x, old_min_y):
+        """搜索區域原點由 (old_min_x, old_min_y) 移到目前的 (min_x, min_y) 時，平移搜索樹中的狀態 key"""
+        # 各欄位間互不進位，平移原點等於在 x, y 欄位上加上位移量
+        delta = ((old_min_x - self.min_x) << (COORD_BITS + STEP_BITS + self._state_bits)) + (
+            (old_min_y - self.min_y) << (STEP_BITS + self._state_bits)
+        )
+        if delta == 0:
+            return tree
+        return {
+            "g_cost": {key + delta: g for key, g in tree["g_cost"].items()},
+            "parent": {key + delta: p + delta for key, p in tree["parent"].items()},
+            "closed": {key + delta for key in tree["closed"]},
+            "open": {key + delta for key in tree["open"]},
+        }
 
     # ----------------------------------------------------------------
     # 保留原先的兩船 Goodwin FCC 模型函式，計算 u_theta, u_dist, fcc
     # ----------------------------------------------------------------
+    # (平方一律寫成 x * x：結果為正確捨入，與 NumPy 版逐元素相同；x ** 2 經 pow() 偶有 1 ulp 誤差)
     def calc_u_theta(self, theta1, theta2):
         angle_diff = abs(theta1 - theta2)
-        return (17 / 44) * (
-            math.cos(math.radians(angle_diff - 19))
-            + math.sqrt(440 / 289 + math.cos(math.radians(angle_diff - 19)) ** 2)
-        )
+        cos_term = math.cos(math.radians(angle_diff - 19))
+        return (17 / 44) * (cos_term + math.sqrt(440 / 289 + cos_term * cos_term))
 
     def calc_u_dist(self, dist, theta1, theta2):
         if dist > self.TWICE_SECTER_RADIUS_MAX:
@@ -126,24 +630,52 @@ class n_fcc_a:
             return 1
         delta = abs(theta1 - theta2)
         if 67.5 <= delta < 180:
-            return (
-                (self.INTERVAL_PARAMETER_67_180 - dist) / self.INTERVAL_PARAMETER_67_180
-            ) ** 2
+            ratio = (
+                self.INTERVAL_PARAMETER_67_180 - dist
+            ) / self.INTERVAL_PARAMETER_67_180
         elif 247.5 <= delta < 360:
-            return (
-                (self.INTERVAL_PARAMETER_245_360 - dist)
-                / self.INTERVAL_PARAMETER_245_360
-            ) ** 2
+            ratio = (
+                self.INTERVAL_PARAMETER_245_360 - dist
+            ) / self.INTERVAL_PARAMETER_245_360
         else:
-            return (
-                (self.INTERVAL_PARAMETER_0_67 - dist) / self.INTERVAL_PARAMETER_0_67
-            ) ** 2
+            ratio = (self.INTERVAL_PARAMETER_0_67 - dist) / self.INTERVAL_PARAMETER_0_67
+        return ratio * ratio
 
     def calc_fcc(self, dist, theta1, theta2):
         return 0.5 * self.calc_u_theta(theta1, theta2) + 0.5 * self.calc_u_dist(
             dist, theta1, theta2
         )
 
+    # ----------------------------------------------------------------
+    # 以上三個函式的 NumPy 版本：參數可為 (可廣播的) 陣列，逐元素計算，
+    # 運算順序與純量版相同，每個元素的結果與純量版完全一致
+    # ----------------------------------------------------------------
+    def calc_u_theta_array(self, theta1, theta2):
+        cos_term = np.cos(np.radians(np.abs(theta1 - theta2) - 19))
+        return (17 / 44) * (cos_term + np.sqrt(440 / 289 + cos_term * cos_term))
+
+    def calc_u_dist_array(self, dist, theta1, theta2):
+        dist = np.asarray(dist, dtype=float)
+        delta = np.abs(theta1 - theta2)
+        # 依相對方位分段 (67.5~180、247.5~360、其餘) 選擇區間參數
+        interval = np.where(
+            (67.5 <= delta) & (delta < 180),
+            self.INTERVAL_PARAMETER_67_180,
+            np.where(
+                (247.5 <= delta) & (delta < 360),
+                self.INTERVAL_PARAMETER_245_360,
+                self.INTERVAL_PARAMETER_0_67,
+            ),
+        )
+        ratio = (interval - dist) / interval
+        u_dist = np.where(dist < self.TWICE_SECTER_RADIUS_MIN, 1.0, ratio * ratio)
+        return np.where(dist > self.TWICE_SECTER_RADIUS_MAX, 0.0, u_dist)
+
+    def calc_fcc_array(self, dist, theta1, theta2):
+        return 0.5 * self.calc_u_theta_array(theta1, theta2) + 0.5 * self.calc_u_dist_array(
+            dist, theta1, theta2
+        )
+
     # ---------------------------
     # 依需求保留，供主程式測試用 (移動一格為一步)
     # ---------------------------
@@ -181,16 +713,50 @@ class n_fcc_a:
     # A* 中要用的啟發式 (_heuristic)
     # 這裡把所有干擾船「同時間 t」的 FCC 都加總
     # ---------------------------
-    def _heuristic(self, state):
-        x, y, t, curr_h, _ = state
-        # 1) 對目標的距離
+    def _heuristic(self, x, y, t, code):
+        # 1) 對目標的距離 (有距離表就用考慮轉向的距離；t == 0 時航向不在八方向內，用八方向距離)
         dx_goal = abs(x - self.yield_goal[0])
         dy_goal = abs(y - self.yield_goal[1])
-        h_dist = (math.sqrt(2) - 1) * min(dx_goal, dy_goal) + max(dx_goal, dy_goal)
+        h_dist = None
+        if self.distance_field is not None and t > 0:
+            h_dist = self.distance_field.distance(x, y, code)
+        if h_dist is None:
+            h_dist = (math.sqrt(2) - 1) * min(dx_goal, dy_goal) + max(dx_goal, dy_goal)
+        if self.fcc_mode == "edge":
+            # FCC 已計入移動成本：剩下至少 Chebyshev 距離那麼多步，每步至少付出 FCC 下界
+            # (每步 Chebyshev 距離最多減一，故此啟發式仍為 consistent)
+            return h_dist + max(dx_goal, dy_goal) * self._fcc_step_lower_bound
 
         # 2) 估計 FCC(針對所有干擾船)
-        sum_fcc_cost = 0
-        for ip in self.interfering_paths:
+        return h_dist + self._fcc_at(x, y, t)
+
+    def _fcc_at(self, x, y, t):
+        """(x, y, t) 的 FCC 成本：先查記憶表，沒有才逐點計算"""
+        stats = self.fcc_cache_stats
+        memo = self._fcc_memo_table
+        if memo is None:
+            stats["misses"] += 1
+            return self._fcc_cost(x, y, t)
+        key = (min(t, self._fcc_last_step), x, y)
+        value = memo.get(key)
+        if value is None:
+            stats["misses"] += 1
+            # 追加干擾船前算過的部分總和，只需從第 start 艘干擾船接著加
+            total, start = self._fcc_partial.get(key, (0, 0))
+            total = self._fcc_sum(x, y, t, self.interfering_paths[start:], total)
+            self._fcc_partial[key] = (total, len(self.interfering_paths))
+            value = memo[key] = self.fcc_scale * total
+        else:
+            stats["hits"] += 1
+        return value
+
+    def _fcc_cost(self, x, y, t):
+        """逐點計算 (x, y, t) 上所有干擾船 FCC 的總和 (已乘上 fcc_scale)"""
+        return self.fcc_scale * self._fcc_sum(x, y, t, self.interfering_paths)
+
+    def _fcc_sum(self, x, y, t, interfering_paths, sum_fcc_cost=0):
+        """把 interfering_paths 中各干擾船在 (x, y, t) 的 FCC 依序加到 sum_fcc_cost (未縮放)"""
+        for ip in interfering_paths:
             grid_path = ip["grid_path"]
             headings = ip["headings"]
             # 若 t 超過此干擾船的 path，則視為停在最後一格
@@ -216,99 +782,394 @@ class n_fcc_a:
             fcc_val = self.calc_fcc(D, yield_theta, other_head)
             sum_fcc_cost += fcc_val
 
-        # 總和 FCC 後再乘以縮放
-        return h_dist + self.fcc_scale * sum_fcc_cost
+        return sum_fcc_cost
+
+    # ---------------------------
+    # 狀態編碼 / 解碼
+    # ---------------------------
+    def _pack_state(self, x, y, t, codes):
+        """把 (x, y, t, 方向碼) 打包成一個 int，作為 g_cost / parent / closed 的 key"""
+        key = (x - self.min_x + COORD_OFFSET) << COORD_BITS
+        key = (key | (y - self.min_y + COORD_OFFSET)) << STEP_BITS
+        key = ((key | t) << DIRECTION_BITS) | (codes & 0b111)
+        return (key << self._code_bits) | codes
+
+    def _unpack_state(self, key):
+        """_pack_state 的反函式，回傳 (x, y, t, codes)"""
+        codes = key & self._code_mask
+        key >>= self._state_bits
+        t = key & STEP_MASK
+        key >>= STEP_BITS
+        y = (key & COORD_MASK) - COORD_OFFSET + self.min_y
+        x = (key >> COORD_BITS) - COORD_OFFSET + self.min_x
+        return x, y, t, codes
+
+    def _state_heading(self, t, codes):
+        """目前航向：最後一步的方向，t == 0 時為起始航向"""
+        if t == 0:
+            return self.yield_heading
+        return DIRECTION_HEADINGS[codes & 0b111]
 
     # ---------------------------
     # 產生鄰居：允許 8 方向移動
+    # 回傳 [(鄰居 key, 方向碼), ...]
     # ---------------------------
-    def _neighbors(self, state):
-        x, y, t, curr_h, h_history = state  # h_history: tuple of previous headings
+    def _neighbors(self, key):
+        x, y, t, codes = self._unpack_state(key)
+        # 可走的方向：與航向歷史中每個航向相差 < 90°。
+        # 每走一步 t 加一，故歷史中仍保留起始航向若且唯若 t < heading_history_length
+        if t < self.heading_history_length:
+            allowed = self._successor_masks[t][codes] & self._start_mask
+        else:
+            allowed = self._successor_masks[-1][codes]
+
+        base = key >> self._state_bits
+        reservations = self.reservations
         nbrs = []
-        for dx in [-1, 0, 1]:
-            for dy in [-1, 0, 1]:
-                if dx == 0 and dy == 0:
+        for code in MASK_CODES[allowed]:
+            # bounded 模式：捨棄搜索區域外、或剩餘步數已不可能走到目標的節點
+            # (每步 x, y 最多各移動一格，故至少還要 Chebyshev 距離那麼多步)
+            if self.bounded:
+                dx, dy = DIRECTIONS[code]
+                nx, ny = x + dx, y + dy
+                if not (
+                    self.min_x <= nx <= self.max_x
+                    and self.min_y <= ny <= self.max_y
+                ):
                     continue
-                # 計算候選航向
-                cand_h = math.degrees(math.atan2(dx, dy)) % 360
-
-                # 與歷史航向比對，若有任一差異 >= 90° 則捨棄此候選
-                valid = True
-                for past_h in h_history:
-                    diff = abs((cand_h - past_h + 180) % 360 - 180)
-                    if diff >= 90:
-                        valid = False
-                        break
-                if not valid:
+                remaining = max(
+                    abs(nx - self.yield_goal[0]), abs(ny - self.yield_goal[1])
+                )
+                if t + 1 + remaining > self.max_steps:
+                    continue
+            if reservations is not None:
+                dx, dy = DIRECTIONS[code]
+                if reservations.blocks_move(x, y, x + dx, y + dy, t + 1):
+                    self.search_stats["reserved_pruned"] += 1
                     continue
 
-                # 更新航向歷史：若未滿預設長度則直接加；否則捨棄最舊的
-                if len(h_history) < self.heading_history_length:
-                    new_history = h_history + (cand_h,)
-                else:
-                    new_history = h_history[1:] + (cand_h,)
-
-                nbrs.append((x + dx, y + dy, t + 1, cand_h, new_history))
+            # 更新航向歷史：移入新方向碼，超過 heading_history_length 的舊碼被遮罩掉
+            new_codes = ((codes << DIRECTION_BITS) | code) & self._code_mask
+            nbrs.append(
+                (
+                    ((base + self._step_deltas[code]) << self._state_bits)
+                    | self._code_fields[code]
+                    | new_codes,
+                    code,
+                )
+            )
         return nbrs
 
-
     # ---------------------------
     # A* 搜索主體
+    # 狀態皆以 _pack_state 的整數表示；回傳 [(x, y, t, heading), ...]
     # ---------------------------
-    def _a_star(self):
-        start_state = (
-            self.yield_pos[0],
-            self.yield_pos[1],
-            0,
-            self.yield_heading,
-            (self.yield_heading,),  # 初始歷史只有起始航向
-        )
+    def _a_star(self, resume=None, cancel=None):
+        """
+        resume: 由 IncrementalPlanner 修補過的舊搜索樹
+           {"g_cost", "parent", "closed", "open"}，給定時從其 OPEN 繼續搜索
+           (以目前的啟發式重新計算 f)，而不是從起點重來
+        cancel: CancellationToken，被取消時回傳 []
+        """
+        edge_fcc = self.fcc_mode == "edge"
+        reservations = self.reservations
+        stats = {
+            "expansions": 0,
+            "pushes": 1,
+            "g_updates": 0,
+            "stale_pops": 0,
+            "reserved_pruned": 0,
+            "cancelled": False,
+        }
+        self.search_stats = stats
+
+        start_state = self._pack_state(self.yield_pos[0], self.yield_pos[1], 0, 0)
         goal_xy = (self.yield_goal[0], self.yield_goal[1])
 
-        open_heap = []
-        g_cost = {start_state: 0}
-        parent = {}
-        f_start = self._heuristic(start_state)
-        heapq.heappush(open_heap, (f_start, start_state))
-        closed = set()
+        open_heap = make_open_list(self.open_list)
+        if resume is None:
+            g_cost = {start_state: 0}
+            parent = {}
+            f_start = self._heuristic(self.yield_pos[0], self.yield_pos[1], 0, 0)
+            open_heap.push(f_start, 0, start_state)
+            closed = set()
+        else:
+            g_cost = resume["g_cost"]
+            parent = resume["parent"]
+            closed = resume["closed"]
+            for state in resume["open"]:
+                sx, sy, st, scodes = self._unpack_state(state)
+                g = g_cost[state]
+                open_heap.push(g + self._heuristic(sx, sy, st, scodes & 0b111), g, state)
+            stats["pushes"] = len(open_heap)
 
         while open_heap:
-            current_f, current = heapq.heappop(open_heap)
-            if (current[0], current[1]) == goal_xy:
+            if (
+                cancel is not None
+                and stats["expansions"] % DEADLINE_CHECK_INTERVAL == 0
+                and cancel.cancelled
+            ):
+                stats["cancelled"] = True
+                return []
+            current_f, current = open_heap.pop()
+            if current in closed:
+                # 同一狀態曾以較低 f 被推入並已展開，這筆是過期項目
+                stats["stale_pops"] += 1
+                continue
+            x, y, t, codes = self._unpack_state(current)
+            if (x, y) == goal_xy and (
+                reservations is None or reservations.free_from(x, y, t)
+            ):
+                if self.keep_search_tree:
+                    open_states = {s for s in open_heap if s not in closed}
+                    open_states.add(current)
+                    self.search_tree = {
+                        "g_cost": g_cost,
+                        "parent": parent,
+                        "closed": closed,
+                        "open": open_states,
+                    }
                 # 回溯路徑
-                path = []
-                state = current
-                while state in parent:
-                    path.append(state)
-                    state = parent[state]
-                path.append(start_state)
-                path.reverse()
-                return path
+                return self._trace_path(current, parent)
 
             closed.add(current)
-            for neighbor in self._neighbors(current):
+            stats["expansions"] += 1
+            for neighbor, code in self._neighbors(current):
                 if neighbor in closed:
                     continue
-                dx = neighbor[0] - current[0]
-                dy = neighbor[1] - current[1]
+                dx, dy = DIRECTIONS[code]
                 step_cost = math.sqrt(2) if (dx != 0 and dy != 0) else 1
+                if edge_fcc:
+                    step_cost += self._fcc_at(x + dx, y + dy, t + 1)
                 tentative_g = g_cost[current] + step_cost
 
                 if neighbor not in g_cost or tentative_g < g_cost[neighbor]:
+                    if neighbor in g_cost:
+                        stats["g_updates"] += 1
+                    stats["pushes"] += 1
                     g_cost[neighbor] = tentative_g
                     parent[neighbor] = current
-                    f_val = tentative_g + self._heuristic(neighbor)
-                    heapq.heappush(open_heap, (f_val, neighbor))
+                    f_val = tentative_g + self._heuristic(x + dx, y + dy, t + 1, code)
+                    open_heap.push(f_val, tentative_g, neighbor)
 
         return []
 
+    # ---------------------------
+    # Anytime weighted A* (ARA*)：在 deadline 前先以大權重快速找到路徑，
+    # 時間還夠就逐步降低權重、沿用已搜索的節點改善路徑
+    # ---------------------------
+    def _ara_star(self, deadline, cancel=None):
+        """
+        deadline: time.perf_counter() 的絕對時間點
+        cancel: CancellationToken，被取消時回傳 [] (不回傳已找到的路徑)
+        回傳目前最好的路徑 [(x, y, t, heading), ...]，時間內一條都找不到則回傳 []。
+
+        self.search_stats 與 _a_star 相同，只有可加總的數值，另外記錄：
+          - "rounds": 完成的輪數
+          - "timed_out": 是否因 deadline 中止
+        非數值的結果另存於 self.anytime_stats (並放入 analysis["anytime"])：
+          - "weight": 最後完成的一輪所用的權重
+          - "suboptimality_bound": 該路徑成本 / 最佳成本 的上界；
+            僅 fcc_mode="edge" (啟發式 admissible) 時有意義，否則為 None
+          - "iterations": 每一輪的 (權重, 路徑成本, 上界, 累計秒數)
+        """
+        edge_fcc = self.fcc_mode == "edge"
+        reservations = self.reservations
+        stats = {
+            "expansions": 0,
+            "pushes": 1,
+            "g_updates": 0,
+            "stale_pops": 0,
+            "reserved_pruned": 0,
+            "rounds": 0,
+            "timed_out": False,
+            "cancelled": False,
+        }
+        self.search_stats = stats
+        anytime = {"weight": None, "suboptimality_bound": None, "iterations": []}
+        self.anytime_stats = anytime
+        t_begin = time.perf_counter()
+
+        start_state = self._pack_state(self.yield_pos[0], self.yield_pos[1], 0, 0)
+        goal_xy = (self.yield_goal[0], self.yield_goal[1])
+        if self.yield_pos == goal_xy:
+            return [(self.yield_pos[0], self.yield_pos[1], 0, self.yield_heading)]
+
+        g_cost = {start_state: 0}
+        parent = {}
+        h_cost = {start_state: self._heuristic(self.yield_pos[0], self.yield_pos[1], 0, 0)}
+        # open_keys: OPEN 中每個狀態目前有效的 key，heap 中 key 不符者為過期項目
+        open_keys = {start_state: None}
+        incons = set()
+        # 目前最好的目標狀態 (目標狀態不展開，只在產生時更新)
+        best_goal = None
+        best_goal_g = math.inf
+        best_goal_h = 0
+        best_path = []
+
+        for weight in self.anytime_weights:
+            # 新一輪：OPEN ∪ INCONS 以新權重重新計算 key，CLOSED 清空
+            for state in incons:
+                open_keys[state] = None
+            incons = set()
+            open_heap = []
+            for state in open_keys:
+                key = g_cost[state] + weight * h_cost[state]
+                open_keys[state] = key
+                open_heap.append((key, state))
+            heapq.heapify(open_heap)
+            closed = set()
+
+            while open_heap:
+                if stats["expansions"] % DEADLINE_CHECK_INTERVAL == 0:
+                    if cancel is not None and cancel.cancelled:
+                        stats["cancelled"] = True
+                        return []
+                    if time.perf_counter() >= deadline:
+                        stats["timed_out"] = True
+                        break
+                key, current = open_heap[0]
+                if open_keys.get(current) != key:
+                    heapq.heappop(open_heap)
+                    stats["stale_pops"] += 1
+                    continue
+                # 目前的解在此權重下已不輸給 OPEN 中任何節點，本輪結束
+                if best_goal is not None and best_goal_g + weight * best_goal_h <= key:
+                    break
+                heapq.heappop(open_heap)
+                del open_keys[current]
+                closed.add(current)
+                stats["expansions"] += 1
+
+                x, y, t, codes = self._unpack_state(current)
+                for neighbor, code in self._neighbors(current):
+                    dx, dy = DIRECTIONS[code]
+                    step_cost = math.sqrt(2) if (dx != 0 and dy != 0) else 1
+                    if edge_fcc:
+                        step_cost += self._fcc_at(x + dx, y + dy, t + 1)
+                    tentative_g = g_cost[current] + step_cost
+                    if neighbor in g_cost and tentative_g >= g_cost[neighbor]:
+                        continue
+                    if neighbor in g_cost:
+                        stats["g_updates"] += 1
+                    g_cost[neighbor] = tentative_g
+                    parent[neighbor] = current
+
+                    if neighbor not in h_cost:
+                        h_cost[neighbor] = self._heuristic(x + dx, y + dy, t + 1, code)
+                    if (x + dx, y + dy) == goal_xy and (
+                        reservations is None or reservations.free_from(x + dx, y + dy, t + 1)
+                    ):
+                        if tentative_g < best_goal_g:
+                            best_goal = neighbor
+                            best_goal_g = tentative_g
+                            best_goal_h = h_cost[neighbor]
+                        continue
+                    if neighbor in closed:
+                        # 本輪已展開過，留待下一輪 (較小權重) 再處理
+                        incons.add(neighbor)
+                        continue
+                    new_key = tentative_g + weight * h_cost[neighbor]
+                    open_keys[neighbor] = new_key
+                    heapq.heappush(open_heap, (new_key, neighbor))
+                    stats["pushes"] += 1
+
+            if stats["timed_out"]:
+                break
+            if best_goal is None:
+                # 目標不可達
+                break
+
+            # 本輪完成：記錄路徑與次佳上界
+            bound = None
+            if edge_fcc:
+                remaining = [g_cost[s] + h_cost[s] for s in open_keys] + [
+                    g_cost[s] + h_cost[s] for s in incons
+                ]
+                lower = min(remaining) if remaining else best_goal_g
+                bound = weight if lower <= 0 else min(weight, max(1.0, best_goal_g / lower))
+            best_path = self._trace_path(best_goal, parent)
+            stats["rounds"] += 1
+            anytime["weight"] = weight
+            anytime["suboptimality_bound"] = bound
+            anytime["iterations"].append(
+                (weight, best_goal_g, bound, time.perf_counter() - t_begin)
+            )
+            if bound == 1.0:
+                break
+
+        return best_path
+
+    def _trace_path(self, goal_state, parent):
+        """由 parent 從 goal_state 回溯到起點，回傳 [(x, y, t, heading), ...]"""
+        path = []
+        state = goal_state
+        while state in parent:
+            path.append(state)
+            state = parent[state]
+        path.append(state)
+        path.reverse()
+        result = []
+        for state in path:
+            sx, sy, st, scodes = self._unpack_state(state)
+            result.append((sx, sy, st, self._state_heading(st, scodes)))
+        return result
+
+    def _search_analysis(self):
+        """analysis 中一定有的搜索統計；ARA* 另有 "anytime" """
+        stats = {
+            "search_stats": self.search_stats,
+            "fcc_cache": dict(self.fcc_cache_stats),
+        }
+        if self.anytime_stats is not None:
+            stats["anytime"] = self.anytime_stats
+        return stats
+
     # ---------------------------
     # 主函式：計算規劃船的路徑
     # 回傳 (路徑座標(公尺), 每步航向列表)
+    # deadline: time.perf_counter() 的絕對時間點；給定時改用 anytime 的 ARA*，
+    #           在期限前回傳目前最好的路徑，並於 anytime_stats 記錄次佳上界
+    # resume: 見 _a_star，僅在沒有 deadline 時使用；
+    #         未給定時沿用 add_interfering_paths(warm_start=True) 留下的搜索樹
+    # cancel: CancellationToken；被取消時回傳 ([], [])，
+    #         analysis["search_stats"] 為中止當下的統計，其中 "cancelled" 為 True
+    # analysis: 本次的路徑分析方式 (ANALYSIS_MODES)，None 則用建構時的設定
     # ---------------------------
-    def calculate_path(self):
-        yield_path_states = self._a_star()  # (x, y, t, heading)
+    def calculate_path(self, deadline=None, resume=None, cancel=None, analysis=None):
+        if analysis is None:
+            analysis = self.analysis_mode
+        elif analysis not in ANALYSIS_MODES:
+            raise ValueError(f"analysis 必須是 {ANALYSIS_MODES} 之一，收到 {analysis!r}")
+        self.fcc_cache_stats = {"hits": 0, "misses": 0}
+        if self.use_distance_field and (
+            self.distance_field is None
+            or not self.distance_field.covers(
+                self.yield_goal, self.min_x, self.max_x, self.min_y, self.max_y
+            )
+        ):
+            self.distance_field = DistanceField(
+                self.yield_goal, self.min_x, self.max_x, self.min_y, self.max_y
+            )
+        if resume is None:
+            resume = self._warm_start_tree
+        self._warm_start_tree = None
+        self.search_tree = None
+        self.anytime_stats = None
+        if self.reservations is not None and self.reservations.is_parked(*self.yield_goal):
+            # 終點在其他船的終點附近，永遠無法停在該處
+            self.search_stats = {"expansions": 0, "goal_parked": True}
+            self.analysis = self._search_analysis()
+            return [], []
+        if cancel is not None and cancel.cancelled:
+            self.search_stats = {"expansions": 0, "cancelled": True}
+            yield_path_states = []
+        elif deadline is None:
+            yield_path_states = self._a_star(resume, cancel)  # (x, y, t, heading)
+        else:
+            yield_path_states = self._ara_star(deadline, cancel)
         if not yield_path_states:
+            self.analysis = self._search_analysis()
             return [], []
 
         # 只取格子座標 (x,y)
@@ -319,22 +1180,18 @@ class n_fcc_a:
             (x * self.grid_scale, y * self.grid_scale) for (x, y) in yield_path_grid
         ]
 
-        # 分析過程 (時間步、位置、heading)
-        analysis_positions = yield_path_m
-        analysis_steps = [s[2] for s in yield_path_states]
-
         # 估算規劃船在每個步驟的航向(度)
         # (此處做個簡單的近似：用前 k_step 筆來估計當前 heading)
         k_step = 3
         computed_headings = []
-        for i in range(len(analysis_positions)):
+        for i in range(len(yield_path_m)):
             if i == 0:
                 # 第一點就給初始航向
                 computed_headings.append(self.yield_heading)
             else:
                 j = max(0, i - k_step)
-                start_pos = analysis_positions[j]
-                pos = analysis_positions[i]
+                start_pos = yield_path_m[j]
+                pos = yield_path_m[i]
                 dx = pos[0] - start_pos[0]
                 dy = pos[1] - start_pos[1]
                 dist = math.hypot(dx, dy)
@@ -345,41 +1202,203 @@ class n_fcc_a:
                     head_angle = math.degrees(math.atan2(dx, dy)) % 360
                     computed_headings.append(head_angle)
 
-        # 計算 FCC (把所有干擾船在同一步的干擾都加總)
-        computed_fcc = []
-        for i, pos in enumerate(analysis_positions):
-            sum_fcc_i = 0
-            yield_head_i = computed_headings[i]
-            for ip in self.interfering_paths:
-                grid_path = ip["grid_path"]
-                headings = ip["headings"]
-                if i < len(grid_path):
-                    other_pos_grid = grid_path[i]
-                    other_head = headings[i]
-                else:
-                    other_pos_grid = grid_path[-1]
-                    other_head = headings[-1]
+        # 存在 self.analysis 以供外部調用或畫圖
+        stats = self._search_analysis()
+        if analysis == "off":
+            self.analysis = stats
+        else:
+            # 之後 add_interfering_paths 會改變干擾船，先記下這次搜索的
+            interfering_paths = list(self.interfering_paths)
+
+            def compute():
+                return {
+                    "steps": [s[2] for s in yield_path_states],
+                    "positions": yield_path_m,
+                    "headings": computed_headings,
+                    "fcc": self._path_fcc(yield_path_m, computed_headings, interfering_paths),
+                }
 
-                # 距離需用公尺
-                dx = pos[0] - (other_pos_grid[0] * self.grid_scale)
-                dy = pos[1] - (other_pos_grid[1] * self.grid_scale)
-                D = math.hypot(dx, dy)
+            if analysis == "lazy":
+                self.analysis = LazyAnalysis(stats, compute)
+            else:
+                self.analysis = {**compute(), **stats}
 
-                # 計算 FCC
-                sum_fcc_i += self.calc_fcc(D, yield_head_i, other_head)
+        # 回傳路徑(公尺)及對應的航向列表
+        return yield_path_m, computed_headings
 
-            computed_fcc.append(sum_fcc_i * self.fcc_scale)
 
-        # 存在 self.analysis 以供外部調用或畫圖
-        self.analysis = {
-            "steps": analysis_steps,
-            "positions": analysis_positions,
-            "headings": computed_headings,
-            "fcc": computed_fcc,
-        }
+    def _path_fcc(self, positions, yield_headings, interfering_paths):
+        """路徑每一步的 FCC (把所有干擾船在同一步的干擾都加總)，每艘干擾船一次陣列運算"""
+        n_steps = len(positions)
+        steps = np.arange(n_steps)
+        positions = np.asarray(positions, dtype=float).reshape(n_steps, 2)
+        yield_heads = np.asarray(yield_headings, dtype=float)
+        sum_fcc = np.zeros(n_steps)
+        for ip in interfering_paths:
+            grid_path = np.asarray(ip["grid_path"], dtype=float)
+            headings = np.asarray(ip["headings"], dtype=float)
+            # 若 i 超過此干擾船的 path，則視為停在最後一格
+            idx = np.minimum(steps, len(grid_path) - 1)
+            head_idx = np.where(steps < len(grid_path), steps, len(headings) - 1)
 
-        # 回傳路徑(公尺)及對應的航向列表
-        return yield_path_m, computed_headings
+            # 距離需用公尺；以 math.hypot 逐點計算 (np.hypot 與其偶有 1 ulp 差異)
+            dx = positions[:, 0] - grid_path[idx, 0] * self.grid_scale
+            dy = positions[:, 1] - grid_path[idx, 1] * self.grid_scale
+            D = np.fromiter(map(math.hypot, dx.tolist(), dy.tolist()), float, n_steps)
+
+            sum_fcc += self.calc_fcc_array(D, yield_heads, headings[head_idx])
+        return (sum_fcc * self.fcc_scale).tolist()
+
+
+class IncrementalPlanner:
+    """
+    跨多次重算保留搜索樹的單船規劃器 (每艘船一個，由呼叫端保存)。
+
+    n_fcc_a 的狀態帶有時間步 t，整張狀態圖依 t 分層 (無環)，
+    時間步 t 的 g 值只取決於起點與 t 之前各步的成本。因此當：
+      - 起點格、起始航向允許的方向、搜索設定都沒變，且
+      - 新的搜索區域落在舊區域內 (沿用舊區域，狀態編碼才一致)
+    就能沿用上一次的搜索樹：
+      - 目標移動：g 與目標無關，整棵樹保留，只以新的啟發式重新計算 OPEN 的 f
+      - 干擾船路徑改變：找出各干擾船 (位置, 航向) 第一個不同的時間步 t_c，
+        只保留 t < t_c 的狀態，並把 t_c - 1 層已展開的狀態重新放回 OPEN
+    干擾船數量不同、起點換格等情況則重新搜索。
+
+    fcc_mode="edge" 時修補後的結果與重新搜索同樣是最佳解；
+    "heuristic" 模式的 g 只有距離，沿用的樹是依舊啟發式展開的，路徑可能與重新搜索不同。
+    有 deadline (ARA*) 時不沿用搜索樹。
+
+    參數：
+      grid_scale, **planner_kwargs: 傳給 n_fcc_a
+    """
+
+    def __init__(self, grid_scale=0.1, **planner_kwargs):
+        self.grid_scale = grid_scale
+        self.planner_kwargs = planner_kwargs
+        self.planner = None  # 上一次使用的 n_fcc_a (含搜索樹)
+        self.interfering_ids = []  # 上一次規劃時參照的干擾船 id，供多船規劃預先帶入
+        self.stats = {"plans": 0, "resumed": 0, "kept_states": 0}
+
+    def plan(
+        self, ship_info, interfering_paths, deadline=None, distance_field=None, cancel=None
+    ):
+        """
+        回傳 (路徑(公尺), 航向列表)，同 n_fcc_a.calculate_path()
+        distance_field: 可沿用的 DistanceField，None 則沿用上一次規劃的
+        cancel: CancellationToken；被取消的搜索不留下搜索樹，下一次重新搜索
+        """
+        if distance_field is None and self.planner is not None:
+            distance_field = self.planner.distance_field
+        planner = n_fcc_a(
+            ship_info=ship_info,
+            interfering_paths=interfering_paths,
+            grid_scale=self.grid_scale,
+            distance_field=distance_field,
+            keep_search_tree=True,
+            **self.planner_kwargs,
+        )
+        resume = None
+        if deadline is None and self.planner is not None:
+            resume = self._repair(self.planner, planner)
+        self.planner = None  # 舊搜索樹已被修補 (或不再需要)，避免重複使用
+
+        path_m, headings = planner.calculate_path(
+            deadline=deadline, resume=resume, cancel=cancel
+        )
+        self.planner = planner
+        self.stats["plans"] += 1
+        if resume is not None:
+            self.stats["resumed"] += 1
+            self.stats["kept_states"] += len(resume["g_cost"])
+        return path_m, headings
+
+    @staticmethod
+    def _start_direction_mask(planner):
+        """起點可走的方向 (與起始航向相差 < 90°)，搜索樹只透過這點依賴起始航向"""
+        return planner._start_mask
+
+    @staticmethod
+    def _first_divergence(old_paths, new_paths):
+        """各干擾船 (位置, 航向) 第一個不同的時間步，完全相同則為 inf"""
+        if len(old_paths) != len(new_paths):
+            return 0
+        t_c = math.inf
+        for old_ip, new_ip in zip(old_paths, new_paths):
+            old_path, old_head = old_ip["grid_path"], old_ip["headings"]
+            new_path, new_head = new_ip["grid_path"], new_ip["headings"]
+            n = max(len(old_path), len(new_path))
+            for t in range(n):
+                if t >= t_c:
+                    break
+                i = min(t, len(old_path) - 1)
+                j = min(t, len(new_path) - 1)
+                if old_path[i] != new_path[j] or old_head[i] != new_head[j]:
+                    t_c = t
+                    break
+        return t_c
+
+    def _repair(self, old, new):
+        """檢查舊搜索樹能否沿用；可以的話把 new 的搜索區域對齊 old，並回傳修補後的樹"""
+        tree = old.search_tree
+        if tree is None:
+            return None
+        if (
+            old.yield_pos != new.yield_pos
+            or old.fcc_mode != new.fcc_mode
+            or old.bounded != new.bounded
+            or old.reservations is not None
+            or new.reservations is not None
+            or self._start_direction_mask(old) != self._start_direction_mask(new)
+        ):
+            return None
+        if not (
+            old.min_x <= new.min_x
+            and new.max_x <= old.max_x
+            and old.min_y <= new.min_y
+            and new.max_y <= old.max_y
+        ):
+            return None
+
+        t_c = self._first_divergence(old.interfering_paths, new.interfering_paths)
+        if old.bounded:
+            # 子節點時間步不超過此值時不可能被步數上限剪枝，換目標也不影響
+            extent = max(old.max_x - old.min_x, old.max_y - old.min_y)
+            t_c = min(t_c, old.max_steps - extent + 1)
+        if t_c <= 0:
+            return None
+
+        # 沿用舊區域，狀態編碼的原點才一致
+        new.min_x, new.max_x = old.min_x, old.max_x
+        new.min_y, new.max_y = old.min_y, old.max_y
+        new.max_steps = old.max_steps
+
+        g_cost = tree["g_cost"]
+        parent = tree["parent"]
+        closed = tree["closed"]
+        open_states = tree["open"]
+        t_shift = new._state_bits
+        if t_c != math.inf and any(
+            ((s >> t_shift) & STEP_MASK) >= t_c for s in open_states
+        ):
+            # 只保留 t < t_c；t_c - 1 層的狀態其子節點被丟掉了，要重新展開
+            g_cost = {s: g for s, g in g_cost.items() if ((s >> t_shift) & STEP_MASK) < t_c}
+            parent = {s: p for s, p in parent.items() if s in g_cost}
+            open_states = {
+                s
+                for s in open_states | closed
+                if s in g_cost and ((s >> t_shift) & STEP_MASK) == t_c - 1
+            } | {s for s in open_states if s in g_cost}
+            closed = {s for s in closed if s in g_cost and s not in open_states}
+
+        # 新目標格上已展開的狀態放回 OPEN，讓它們在 pop 時被判定為抵達目標
+        xy_shift = t_shift + STEP_BITS
+        goal_xy_key = new._pack_state(new.yield_goal[0], new.yield_goal[1], 0, 0) >> xy_shift
+        reached = {s for s in closed if s >> xy_shift == goal_xy_key}
+        if reached:
+            closed = closed - reached
+            open_states = open_states | reached
+
+        return {"g_cost": g_cost, "parent": parent, "closed": closed, "open": open_states}
 
 
 # =============================================================================
@@ -0,0 +1,46 @@
+# open_list.py
+
+"""
+A* 的 OPEN 串列 (優先佇列)
+
+  - HeapOpenList：原本的 heapq 做法，以 (f, state) tuple 排序
+
+曾試過依量化 f 分桶的 bucket queue：單獨測佇列只快約 10%，放進 n_fcc_a 反而較慢
+(edge 模式 7.2 s vs 6.0 s)，因此移除。要比較其他 OPEN 串列時，實作相同介面後
+直接傳給 open_list 參數即可 (見 benchmark.py open_list)：
+  push(f, g, state)、pop() -> (f, state)、len()、iter() 逐一列出仍在 OPEN 中的 state
+"""
+
+import heapq
+
+
+class HeapOpenList:
+    """heapq 版 OPEN 串列：f 相同時比較 state 本身 (原本的行為)"""
+
+    def __init__(self):
+        self._heap = []
+
+    def push(self, f, g, state):
+        heapq.heappush(self._heap, (f, state))
+
+    def pop(self):
+        return heapq.heappop(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return (state for _, state in self._heap)
+
+
+# open_list 參數可用的名稱
+OPEN_LISTS = {"heap": HeapOpenList}
+
+
+def make_open_list(open_list):
+    """open_list 為 OPEN_LISTS 的名稱，或可無參數呼叫、回傳 OPEN 串列的類別/函式"""
+    if callable(open_list):
+        return open_list()
+    if open_list not in OPEN_LISTS:
+        raise ValueError(f"open_list 必須是 {tuple(OPEN_LISTS)} 之一，收到 {open_list!r}")
+    return OPEN_LISTS[open_list]()
@@ -0,0 +1,256 @@
+# plan_cache.py
+
+"""
+多船規劃結果的快取 (以相對敵船的情境為 key)
+
+包圍情境不斷重複：敵船周圍 around_radius 的圓、相同船數、船隊從相近的方位接近。
+PlanCache 以「各船起點 / 目標相對敵船的位置，量化到 quantum 公尺」加上規劃參數為 key，
+記住 multi_ship_planning 的結果 (路徑存成相對敵船的座標)。
+命中時不再搜索，把存下的路徑平移到目前的敵船位置，並把每條路徑的頭尾
+線性修正到這次實際的起點 / 目標 (量化造成的誤差最多約 0.71 * quantum)，再重新計算航向。
+
+  - LRU 淘汰：最多保留 max_entries 個情境
+  - 可給檔案路徑 (pickle)：建立時載入、save() 時寫回，跨次執行沿用
+  - 統計：stats 的 hits / misses / bypassed / evictions / rejected 與 hit_rate
+
+衝突重算常留下少數仍衝突的船對，這些船對 (residual) 與路徑一起存入。
+修正後的路徑會重新檢查船與船之間的衝突 (paths_conflict_batch)，出現存入時沒有的衝突船對
+才視為未命中 (計入 misses 與 rejected) 並重新規劃。
+quantum 越大命中率越高、路徑偏離越多，被拒絕的也越多。
+"""
+
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+from ship_navigation_v1 import (
+    PATH_DTYPE,
+    PATH_STORAGE_DTYPE,
+    _ship_key,
+    multi_ship_planning,
+    paths_conflict_batch,
+    recalc_headings,
+)
+
+# 預設最多保留的情境數
+PLAN_CACHE_SIZE = 256
+# 起點 / 目標相對敵船位置的量化單位 (公尺)
+PLAN_CACHE_QUANTUM = 0.5
+# 不影響規劃結果、或每次都不同的參數，不列入 key
+_UNKEYED_KWARGS = ("distance_field_cache", "planners", "cancel", "fixed_paths", "executor")
+# 快取檔案格式版本，格式不同的檔案不使用
+_FILE_VERSION = 2
+
+
+def _conflict_pairs(paths, safe_distance):
+    """paths 中互相衝突的 (i, j) 索引對 (i < j，空路徑不比對)"""
+    indices = [i for i, path in enumerate(paths) if len(path)]
+    pairs = set()
+    for n, i in enumerate(indices[:-1]):
+        others = indices[n + 1 :]
+        hits = paths_conflict_batch(paths[i], [paths[j] for j in others], safe_distance)
+        pairs.update((i, j) for j, hit in zip(others, hits) if hit)
+    return frozenset(pairs)
+
+
+class PlanCache:
+    """
+    參數：
+      max_entries: 最多保留的情境數，超過時淘汰最久沒用到的
+      quantum: 起點 / 目標相對敵船位置的量化單位 (公尺)
+      path: 快取檔案路徑；檔案存在時於建立時載入，None 則只存在記憶體
+
+    用法：
+      cache = PlanCache(path="plan_cache.pkl")
+      results = cache.plan(ships, enemy_pos_m, grid_scale=0.2, smoothing_method="moving_average")
+      cache.save()
+    """
+
+    def __init__(self, max_entries=PLAN_CACHE_SIZE, quantum=PLAN_CACHE_QUANTUM, path=None):
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.path = path
+        # key -> ([(船的量化特徵, 相對起點, 相對目標, 相對路徑 (N, 4), analysis), ...],
+        #         存入時仍衝突的船對 (依量化特徵排序後的索引))
+        self._entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "rejected": 0}
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def _relative(self, ship, origin):
+        """船的 (相對起點, 相對目標) (公尺)"""
+        return (
+            (ship["pos"][0] - origin[0], ship["pos"][1] - origin[1]),
+            (ship["goal"][0] - origin[0], ship["goal"][1] - origin[1]),
+        )
+
+    def _signature(self, rel_start, rel_goal):
+        q = self.quantum
+        return (
+            round(rel_start[0] / q),
+            round(rel_start[1] / q),
+            round(rel_goal[0] / q),
+            round(rel_goal[1] / q),
+        )
+
+    def _key(self, signatures, planning_kwargs):
+        config = repr(
+            sorted(
+                (name, value)
+                for name, value in planning_kwargs.items()
+                if name not in _UNKEYED_KWARGS
+            )
+        )
+        return tuple(sorted(signatures)), config
+
+    def _ordered(self, ships, origin):
+        """[(量化特徵, 相對起點, 相對目標, 船)]，依量化特徵排序 (與船 id、順序無關)"""
+        items = []
+        for ship in ships:
+            rel_start, rel_goal = self._relative(ship, origin)
+            items.append((self._signature(rel_start, rel_goal), rel_start, rel_goal, ship))
+        items.sort(key=lambda item: item[0])
+        return items
+
+    def get(self, ships, origin, **planning_kwargs):
+        """
+        查詢快取，命中時回傳平移到 origin 的規劃結果 (格式同 multi_ship_planning)，否則回傳 None。
+        ships 的 id 可以與存入時不同，依量化特徵對應。
+        修正後的路徑出現存入時沒有的衝突船對時也回傳 None (計入 misses 與 rejected)
+        """
+        items = self._ordered(ships, origin)
+        key = self._key([item[0] for item in items], planning_kwargs)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        stored_ships, residual = entry
+        results = {}
+        for (_, rel_start, rel_goal, ship), stored in zip(items, stored_ships):
+            _, stored_start, stored_goal, rel_path, analysis = stored
+            path = rel_path.astype(PATH_DTYPE)
+            n = len(path)
+            if n:
+                # 平移到 origin，頭尾的修正量由起點線性過渡到目標
+                start_shift = np.subtract(rel_start, stored_start)
+                goal_shift = np.subtract(rel_goal, stored_goal)
+                s = np.linspace(0.0, 1.0, n)[:, None] if n > 1 else np.zeros((1, 1))
+                xy = rel_path[:, :2].astype(np.float64) + origin
+                xy += (1.0 - s) * start_shift + s * goal_shift
+                path[:, :2] = xy
+                # 頭尾修正改變了各段方向，航向依修正後的路徑重算
+                path[:, 3] = recalc_headings(xy)
+            results[_ship_key(ship)] = {
+                "path": path,
+                "headings": path[:, 3],
+                "analysis": analysis,
+            }
+
+        pairs = _conflict_pairs(
+            [results[_ship_key(item[3])]["path"] for item in items],
+            planning_kwargs.get("safe_distance", 1),
+        )
+        if pairs - residual:
+            self.stats["misses"] += 1
+            self.stats["rejected"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        for data in results.values():
+            data["analysis"] = {**data["analysis"], "plan_cache": {"hit": True, **self.stats}}
+        return results
+
+    def put(self, ships, origin, results, **planning_kwargs):
+        """
+        存入一次規劃的結果 (路徑換成相對 origin 的座標)。
+        仍衝突的船對一併記下，取出時只拒絕修正後新出現的衝突。
+        有船沒有結果、找不到路徑或搜索被取消時不存
+        """
+        items = self._ordered(ships, origin)
+        entry = []
+        for signature, rel_start, rel_goal, ship in items:
+            data = results.get(_ship_key(ship))
+            if data is None or not len(data["path"]):
+                return False
+            analysis = dict(data["analysis"])
+            if analysis.get("search_stats", {}).get("cancelled"):
+                return False
+            analysis.pop("plan_cache", None)
+            rel_path = np.array(data["path"], dtype=PATH_STORAGE_DTYPE)
+            rel_path[:, :2] = data["path"][:, :2].astype(np.float64) - origin
+            entry.append((signature, rel_start, rel_goal, rel_path, analysis))
+        residual = _conflict_pairs(
+            [results[_ship_key(item[3])]["path"] for item in items],
+            planning_kwargs.get("safe_distance", 1),
+        )
+
+        key = self._key([item[0] for item in items], planning_kwargs)
+        self._entries[key] = (entry, residual)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+        return True
+
+    def plan(self, ships, origin, **planning_kwargs):
+        """
+        有快取就用快取，否則呼叫 multi_ship_planning 並存入結果。
+        origin: 敵船位置 (公尺)；planning_kwargs 同 multi_ship_planning。
+        有 fixed_paths (差分重算) 時結果還取決於其他船的路徑，不使用快取
+        """
+        if planning_kwargs.get("fixed_paths"):
+            self.stats["bypassed"] += 1
+            return multi_ship_planning(ships, **planning_kwargs)
+        results = self.get(ships, origin, **planning_kwargs)
+        if results is not None:
+            return results
+        results = multi_ship_planning(ships, **planning_kwargs)
+        cancel = planning_kwargs.get("cancel")
+        if cancel is None or not cancel.cancelled:
+            self.put(ships, origin, results, **planning_kwargs)
+        for data in results.values():
+            data["analysis"]["plan_cache"] = {"hit": False, **self.stats}
+        return results
+
+    def clear(self):
+        self._entries.clear()
+
+    def save(self, path=None):
+        """寫入快取檔案 (先寫暫存檔再取代，中途中斷不會留下損壞的檔案)"""
+        path = path or self.path
+        if path is None:
+            raise ValueError("PlanCache 沒有設定檔案路徑")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {
+                    "version": _FILE_VERSION,
+                    "quantum": self.quantum,
+                    "entries": list(self._entries.items()),
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """載入快取檔案；格式版本或量化單位不同的檔案不使用"""
+        path = path or self.path
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != _FILE_VERSION or data.get("quantum") != self.quantum:
+            return
+        self._entries = OrderedDict(data["entries"])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,206 @@
+# planner_process.py
+
+"""
+在獨立行程中執行 multi_ship_planning
+
+A* 是純 Python，在 threading.Thread 中執行仍會持有 GIL，主迴圈的畫面更新會跟著卡頓。
+PlannerProcess 啟動一個專用的規劃行程，主迴圈只負責送出請求 (submit) 與每幀檢查結果 (poll)，
+兩者都不會阻塞。
+
+  - 請求與結果經 multiprocessing.Queue (底層為 pipe) 傳遞
+  - 最新請求優先：規劃行程取請求時只保留佇列中最新的一個；
+    規劃途中主迴圈又送出新請求時，進行中的搜索經 CancellationToken 中止，
+    主迴圈收到編號不是最新請求的結果直接丟棄
+  - 距離表快取與各船的 IncrementalPlanner 保存在規劃行程中，多次規劃間沿用；reset() 清除
+  - solver="cbs" 與平行 "retry" (solver_kwargs 有 workers) 的 process pool 在規劃行程啟動時建立一次，各次規劃沿用
+  - 可選的 PlanCache (plan_cache.py) 也保存在規劃行程中；請求帶有敵船位置 (origin) 時使用，
+    結束行程時寫回快取檔案
+"""
+
+import multiprocessing
+import atexit
+import os
+import queue
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from multi_ship_planner_v1 import CancellationToken
+from plan_cache import PlanCache
+from ship_navigation_v1 import multi_ship_planning
+
+
+class _LatestRequestToken(CancellationToken):
+    """規劃行程用：主行程送出更新的請求 (共享的最新請求編號改變) 後即視為已取消"""
+
+    def __init__(self, request_id, latest_request):
+        super().__init__()
+        self.request_id = request_id
+        self._latest_request = latest_request
+
+    @property
+    def cancelled(self):
+        return self._latest_request.value != self.request_id
+
+
+def _planner_main(requests, results, latest_request, planning_kwargs, plan_cache_kwargs):
+    """
+    規劃行程的主迴圈
+    latest_request: 共享的最新請求編號 (multiprocessing.Value)
+    plan_cache_kwargs: 建立 PlanCache 的參數，None 則不使用快取
+    requests 中的訊息：("plan", 請求編號, ships_info, 本次請求的額外參數)、("reset",)、("stop",)
+    results 中的訊息：(請求編號, 規劃結果或 None, 錯誤訊息或 None)
+    """
+    distance_field_cache = {}
+    planners = {}
+    plan_cache = PlanCache(**plan_cache_kwargs) if plan_cache_kwargs is not None else None
+    # IncrementalPlanner 只能用於依序規劃的 solver="retry"
+    solver_kwargs = planning_kwargs.get("solver_kwargs") or {}
+    if planning_kwargs.get("solver", "retry") != "retry" or "workers" in solver_kwargs:
+        planners = None
+    # CBS 的低層搜索與平行 retry 的各組沿用同一個 process pool，不在每次規劃時重新啟動子行程
+    executor = None
+    if planning_kwargs.get("solver") == "cbs" or "workers" in solver_kwargs:
+        workers = solver_kwargs.get("workers")
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1:
+            # pool 的子行程也以 spawn 啟動 (不 fork 帶有 Queue 執行緒的規劃行程)。
+            # 以行程預設的啟動方式設定，不用 Python 3.7 才有的 mp_context 參數
+            multiprocessing.set_start_method("spawn", force=True)
+            executor = ProcessPoolExecutor(max_workers=workers)
+    while True:
+        messages = [requests.get()]
+        # 一次取出所有已送達的訊息，規劃請求只保留最新的一個
+        while True:
+            try:
+                messages.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        latest = None
+        for message in messages:
+            if message[0] == "stop":
+                if plan_cache is not None and plan_cache.path is not None:
+                    plan_cache.save()
+                if executor is not None:
+                    # executor.map 在 multi_ship_planning 回傳前已取完結果，這裡沒有未完成的工作
+                    executor.shutdown()
+                return
+            if message[0] == "reset":
+                distance_field_cache.clear()
+                if planners is not None:
+                    planners.clear()
+            elif message[0] == "plan":
+                latest = message
+        if latest is None:
+            continue
+
+        _, request_id, ships_info, request_kwargs = latest
+        origin = request_kwargs.pop("origin", None)
+        kwargs = dict(
+            distance_field_cache=distance_field_cache,
+            planners=planners,
+            cancel=_LatestRequestToken(request_id, latest_request),
+            executor=executor,
+            **planning_kwargs,
+            **request_kwargs,
+        )
+        try:
+            if plan_cache is not None and origin is not None:
+                result = plan_cache.plan(ships_info, origin, **kwargs)
+            else:
+                result = multi_ship_planning(ships_info, **kwargs)
+            results.put((request_id, result, None))
+        except Exception:
+            results.put((request_id, None, traceback.format_exc()))
+
+
+class PlannerProcess:
+    """
+    專用的規劃行程
+
+    參數：
+      plan_cache: 建立 PlanCache 的參數 (dict，例如 {"path": "plan_cache.pkl"})，None 則不使用快取
+      **planning_kwargs: 每次規劃都傳給 multi_ship_planning 的參數
+        (distance_field_cache / planners / cancel / executor 由規劃行程自行處理，不可給)
+
+    用法：
+      planner = PlannerProcess(smoothing_method="moving_average")
+      planner.submit(ships_info)        # 不阻塞，回傳請求編號
+      planner.submit(ships_info, fixed_paths=kept)  # 只用於這次請求的參數
+      planner.submit(ships_info, origin=enemy_pos_m)  # 給敵船位置 (公尺) 時查 PlanCache
+      result = planner.poll()           # 每幀呼叫；最新請求的結果算好前回傳 None
+      planner.close()
+    """
+
+    def __init__(self, plan_cache=None, **planning_kwargs):
+        # 一律以 spawn 啟動：規劃行程不繼承主行程的 pygame / SDL 狀態
+        ctx = multiprocessing.get_context("spawn")
+        self._requests = ctx.Queue()
+        self._results = ctx.Queue()
+        self._latest_request = ctx.Value("q", 0)
+        # 不設為 daemon：daemon 行程不能再建立子行程，solver="cbs" 與平行規劃
+        # (solver_kwargs["workers"]) 都需要 process pool。改由 close() 結束，
+        # 並以 atexit 確保主程式結束時一定會呼叫。
+        # spawn 的子行程會以 __mp_main__ 重新載入主程式模組，主程式須以
+        # if __name__ == "__main__": 保護遊戲本身 (見 main.py)
+        self._process = ctx.Process(
+            target=_planner_main,
+            args=(self._requests, self._results, self._latest_request, planning_kwargs, plan_cache),
+        )
+        self._process.start()
+        atexit.register(self.close)
+
+        self.latest_request = 0  # 最近一次送出的請求編號
+        self.latest_done = 0  # 最近一次收到結果的請求編號
+        self.stale_results = 0  # 因已有更新的請求而丟棄的結果數
+        self.error = None  # 最新請求失敗時的錯誤訊息
+
+    @property
+    def busy(self):
+        """最新的請求是否仍在規劃中"""
+        return self.latest_done != self.latest_request
+
+    def submit(self, ships_info, **request_kwargs):
+        """
+        送出規劃請求 (不阻塞)，回傳請求編號。尚未處理的舊請求會被略過，規劃中的會被中止。
+        request_kwargs 只用於這次請求，與 planning_kwargs 一起傳給 multi_ship_planning；
+        其中 origin (敵船位置，公尺) 用於查 PlanCache，不傳給 multi_ship_planning
+        """
+        self.latest_request += 1
+        self._latest_request.value = self.latest_request
+        self._requests.put(("plan", self.latest_request, ships_info, request_kwargs))
+        return self.latest_request
+
+    def poll(self):
+        """
+        取出最新請求的規劃結果 (不阻塞)。
+        尚未算好、或規劃失敗 (錯誤訊息在 self.error) 時回傳 None
+        """
+        result = None
+        while True:
+            try:
+                request_id, planning_results, error = self._results.get_nowait()
+            except queue.Empty:
+                return result
+            if request_id != self.latest_request:
+                self.stale_results += 1
+                continue
+            self.latest_done = request_id
+            self.error = error
+            result = planning_results
+
+    def reset(self):
+        """清除規劃行程保存的距離表與 IncrementalPlanner"""
+        self._requests.put(("reset",))
+
+    def close(self, timeout=1.0):
+        """結束規劃行程 (中止進行中的規劃，快取檔案寫回後結束)"""
+        if self._process.is_alive():
+            # 請求編號從 1 開始，設為 0 即讓進行中的搜索視為已取消
+            self._latest_request.value = 0
+            self._requests.put(("stop",))
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+        atexit.unregister(self.close)
@@ -1,7 +1,15 @@
+import itertools
 import math
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from scipy.interpolate import splprep, splev
-from multi_ship_planner_v1 import n_fcc_a
+from scipy.optimize import linear_sum_assignment
+from multi_ship_planner_v1 import n_fcc_a, IncrementalPlanner, ReservationTable
+from cbs_solver import cbs_solve
+
+# multi_ship_planning 可用的多船協調方式 (預設 "retry"；其他方式的限制見 multi_ship_planning)
+SOLVERS = ("retry", "cooperative", "cbs")
 
 
 def distance(p1, p2):
@@ -37,23 +45,289 @@ def paths_conflict(pathA, pathB, safe_distance):
     return False
 
 
+# paths_conflict_array / paths_conflict_batch 以 np.hypot 判定時的容許誤差 (相對於 safe_distance)：
+# np.hypot 與 math.hypot 偶有 1 ulp 差異，距離落在 safe_distance 附近這個範圍內的時間步
+# 改以 math.hypot 重算，結果與 paths_conflict 完全相同
+_HYPOT_TOLERANCE = 1e-12
+
+
+def _as_path_array(path):
+    """
+    路徑轉為 (N, 2) float64 陣列 (已是陣列則不複製)；(N, 4) 路徑陣列只取 x, y 兩欄。
+    其他形狀 (例如 (N, 3)) 無法判斷哪兩欄是座標，拋出 ValueError
+    """
+    path = np.asarray(path, dtype=np.float64)
+    if path.ndim == 2 and path.shape[1] == len(PATH_COLUMNS):
+        return path[:, :2]
+    if path.size and (path.ndim != 2 or path.shape[1] != 2):
+        raise ValueError(f"路徑必須是 (N, 2) 或 (N, {len(PATH_COLUMNS)}) 陣列，收到 {path.shape}")
+    return path.reshape(-1, 2)
+
+
+def _padded_path(path, length):
+    """(N, 2) 路徑陣列延長到 length 步，超出部分停在最後一點 (同 get_position_at_step)"""
+    if len(path) >= length:
+        return path[:length]
+    return path[np.minimum(np.arange(length), len(path) - 1)]
+
+
+def _conflict_in(dx, dy, safe_distance):
+    """
+    dx, dy: (M, L) 陣列，M 對船在 L 個時間步的座標差。
+    回傳 (M,) bool 陣列：每一對是否有任一步距離 < safe_distance (判定同 math.hypot)
+    """
+    dist = np.hypot(dx, dy)
+    tolerance = safe_distance * _HYPOT_TOLERANCE
+    hit = (dist < safe_distance - tolerance).any(axis=1)
+    near = np.abs(dist - safe_distance) <= tolerance
+    near &= ~hit[:, None]
+    for row, step in zip(*np.nonzero(near)):
+        if math.hypot(dx[row, step], dy[row, step]) < safe_distance:
+            hit[row] = True
+    return hit
+
+
+def _array_box(a):
+    """路徑陣列的外框 (min_x, min_y, max_x, max_y)"""
+    return (*a.min(axis=0).tolist(), *a.max(axis=0).tolist())
+
+
+def _boxes_apart(box_a, box_b, safe_distance):
+    """兩條路徑的外框 (擴張 safe_distance) 不相交，則任一時間步距離都 >= safe_distance"""
+    return (
+        box_a[0] - box_b[2] >= safe_distance
+        or box_b[0] - box_a[2] >= safe_distance
+        or box_a[1] - box_b[3] >= safe_distance
+        or box_b[1] - box_a[3] >= safe_distance
+    )
+
+
+def paths_conflict_array(pathA, pathB, safe_distance):
+    """
+    paths_conflict 的 NumPy 版本，結果相同。pathA / pathB 為 (N, 2) 或 (N, 4) 路徑陣列 (或可轉成陣列的路徑)。
+    先以外框 (擴張 safe_distance) 排除不可能衝突的路徑，
+    否則把較短的路徑以最後一點補齊，一次算出所有時間步的距離
+    """
+    a = _as_path_array(pathA)
+    b = _as_path_array(pathB)
+    if safe_distance <= 0 or _boxes_apart(_array_box(a), _array_box(b), safe_distance):
+        return False
+    length = max(len(a), len(b))
+    a = _padded_path(a, length)
+    b = _padded_path(b, length)
+    diff = a - b
+    return bool(_conflict_in(diff[None, :, 0], diff[None, :, 1], safe_distance)[0])
+
+
+def paths_conflict_batch(path, others, safe_distance):
+    """
+    一次比對 path 與 others 中的每條路徑 (例如 previous_planned_paths 的所有路徑)，
+    回傳 bool 陣列，第 i 個等於 paths_conflict(path, others[i], safe_distance)。
+    others 補齊到相同長度後疊成 (M, L, 2) 陣列，外框 (擴張 safe_distance) 與 path 不相交者
+    先排除，其餘一起計算所有時間步的距離。
+    陣列轉換與批次運算有固定成本，others 少於 CONFLICT_BATCH_MIN_SHIPS 條時
+    逐條呼叫 paths_conflict 較快
+    """
+    p = _as_path_array(path)
+    result = np.zeros(len(others), dtype=bool)
+    if safe_distance <= 0 or not len(others):
+        return result
+    arrays = [_as_path_array(other) for other in others]
+    length = max(len(p), max(len(o) for o in arrays))
+    stacked = np.empty((len(arrays), length, 2))
+    for i, o in enumerate(arrays):
+        stacked[i, : len(o)] = o
+        stacked[i, len(o) :] = o[-1]
+    lo = stacked.min(axis=1)
+    hi = stacked.max(axis=1)
+    p_lo = p.min(axis=0)
+    p_hi = p.max(axis=0)
+    apart = ((lo - p_hi >= safe_distance) | (p_lo - hi >= safe_distance)).any(axis=1)
+    candidates = np.flatnonzero(~apart)
+    if not len(candidates):
+        return result
+    diff = _padded_path(p, length) - stacked[candidates]
+    result[candidates] = _conflict_in(diff[:, :, 0], diff[:, :, 1], safe_distance)
+    return result
+
+
+# PathConflictIndex 以 bx * _BUCKET_STRIDE + by 表示一個桶，_BUCKET_NEIGHBORS 為周圍 3x3 個桶的位移
+_BUCKET_STRIDE = 1 << 20
+_BUCKET_NEIGHBORS = tuple(
+    dx * _BUCKET_STRIDE + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+)
+
+
+class PathConflictIndex:
+    """
+    已確定路徑的時空雜湊，一次找出與候選路徑衝突的所有船；
+    結果與逐船呼叫 paths_conflict 相同 (paths_conflict 保留作為對照基準)。
+
+    每個時間步以 safe_distance 為邊長分桶：時間步 t -> {桶: 該步位於桶內的船}。
+    距離 < safe_distance 的兩點所在的桶相差不超過 1，候選路徑每一步只需查周圍 3x3 個桶。
+    船走完路徑後停在終點 (同 get_position_at_step)，終點在加入時就登記到周圍 3x3 個桶，
+    查詢時每步只需查一個桶。桶以整數表示，
+    極端座標下不同的桶可能共用同一個整數，只會多出需要計算距離的候選，不影響結果。
+
+    參數：
+      safe_distance: 安全距離 (公尺)
+    """
+
+    def __init__(self, safe_distance):
+        self.safe_distance = safe_distance
+        # 桶邊長略大於 safe_distance：捨入誤差不會讓相距 < safe_distance 的點相隔兩桶
+        self._inv_cell = 1 / (safe_distance * (1 + 1e-9)) if safe_distance > 0 else 0
+        self.ships = []  # 加入順序
+        self._moving = {}  # {t: {桶: [(船序號, x, y), ...]}}
+        self._parked = {}  # {桶: [(船序號, x, y, 停泊起始時間步), ...]}，含終點周圍 3x3 個桶
+        self._max_len = 0
+
+    def _bucket(self, x, y):
+        return (
+            math.floor(x * self._inv_cell) * _BUCKET_STRIDE
+            + math.floor(y * self._inv_cell)
+        )
+
+    def add(self, ship):
+        """加入一艘已確定的船 (dict，須含非空的 "path")"""
+        index = len(self.ships)
+        self.ships.append(ship)
+        path = ship["path"]
+        if self.safe_distance <= 0:
+            return
+        moving = self._moving
+        inv_cell = self._inv_cell
+        floor = math.floor
+        for t, (x, y) in enumerate(path[:-1]):
+            bucket = floor(x * inv_cell) * _BUCKET_STRIDE + floor(y * inv_cell)
+            layer = moving.get(t)
+            if layer is None:
+                moving[t] = {bucket: [(index, x, y)]}
+            elif bucket in layer:
+                layer[bucket].append((index, x, y))
+            else:
+                layer[bucket] = [(index, x, y)]
+        x, y = path[-1]
+        bucket = self._bucket(x, y)
+        entry = (index, x, y, len(path) - 1)
+        for offset in _BUCKET_NEIGHBORS:
+            self._parked.setdefault(bucket + offset, []).append(entry)
+        self._max_len = max(self._max_len, len(path))
+
+    def conflicts(self, path):
+        """與 path 衝突的船，依加入順序回傳 (同 [s for s in ships if paths_conflict(path, s["path"], ...)])"""
+        safe_distance = self.safe_distance
+        if safe_distance <= 0 or not self.ships or not path:
+            return []
+        moving = self._moving
+        parked = self._parked
+        neighbors = _BUCKET_NEIGHBORS
+        hypot = math.hypot
+        floor = math.floor
+        inv_cell = self._inv_cell
+        found = set()
+        last = len(path) - 1
+        for t in range(max(len(path), self._max_len)):
+            px, py = path[t] if t < last else path[last]
+            bucket = floor(px * inv_cell) * _BUCKET_STRIDE + floor(py * inv_cell)
+            layer = moving.get(t)
+            if layer:
+                for offset in neighbors:
+                    for index, x, y in layer.get(bucket + offset, ()):
+                        if index not in found and hypot(px - x, py - y) < safe_distance:
+                            found.add(index)
+            for index, x, y, since in parked.get(bucket, ()):
+                if since <= t and index not in found and hypot(px - x, py - y) < safe_distance:
+                    found.add(index)
+            if len(found) == len(self.ships):
+                break
+        return [self.ships[index] for index in sorted(found)]
+
+
+# 衝突比對結構依船數選擇 (見 benchmark.py conflict_check)：
+# 8 艘以下逐船呼叫 paths_conflict (原做法)，陣列轉換與批次運算的固定成本划不來；
+# 8 ~ 14 艘以 paths_conflict_batch 一次比對；15 艘以上用 PathConflictIndex 時空雜湊
+CONFLICT_BATCH_MIN_SHIPS = 8
+CONFLICT_INDEX_MIN_SHIPS = 15
+
+
+class _PathConflictPairwise:
+    """介面同 PathConflictIndex，逐船呼叫 paths_conflict (原做法，船少時最快)"""
+
+    def __init__(self, safe_distance):
+        self.safe_distance = safe_distance
+        self.ships = []
+
+    def add(self, ship):
+        self.ships.append(ship)
+
+    def conflicts(self, path):
+        return [
+            ship for ship in self.ships if paths_conflict(path, ship["path"], self.safe_distance)
+        ]
+
+
+class _PathConflictBatch:
+    """
+    介面同 PathConflictIndex，以 paths_conflict_batch 一次比對所有已確定的船 (船數中等時使用)。
+    路徑在加入時轉成陣列，查詢時不再轉換
+    """
+
+    def __init__(self, safe_distance):
+        self.safe_distance = safe_distance
+        self.ships = []
+        self._arrays = []
+
+    def add(self, ship):
+        self.ships.append(ship)
+        self._arrays.append(_as_path_array(ship["path"]))
+
+    def conflicts(self, path):
+        if not self.ships or not len(path):
+            return []
+        hit = paths_conflict_batch(path, self._arrays, self.safe_distance)
+        return list(itertools.compress(self.ships, hit))
+
+
+def _conflict_checker(safe_distance, num_ships):
+    """最多會有 num_ships 艘已確定的船時使用的衝突比對結構"""
+    if num_ships >= CONFLICT_INDEX_MIN_SHIPS:
+        return PathConflictIndex(safe_distance)
+    if num_ships >= CONFLICT_BATCH_MIN_SHIPS:
+        return _PathConflictBatch(safe_distance)
+    return _PathConflictPairwise(safe_distance)
+
+
 # --------------------
 # 平滑化相關函式
 # --------------------
 def moving_average_smooth(path, window_size=4):
     """
     移動平均平滑化，輸出與輸入路徑相同長度的結果
+    第 i 點取 i - window_size // 2 ~ i + window_size // 2 的平均，頭尾只平均範圍內的點。
+    path 可為 (N, 2) 陣列、(N, 4) 路徑陣列 (都回傳 (N, 2) 陣列) 或座標列表 (回傳 (x, y) 列表)。
+
+    以平移後的整條陣列逐項相加，每點的加總順序與逐點 np.mean 相同；窗口不超過 7 點
+    (window_size <= 7，含預設值) 時結果逐位元一致，更大的窗口 np.mean 改用分組加總，會差在末位。
+    累積和 (cumsum) 相減雖然與窗口大小無關，但捨入誤差會讓預設窗口的結果也與原本不同
     """
-    if len(path) < window_size:
-        return path[:]
-    smoothed = []
+    points = _as_path_array(path)
+    if len(points) < window_size:
+        return points.copy() if isinstance(path, np.ndarray) else path[:]
+    n = len(points)
     half_window = window_size // 2
-    for i in range(len(path)):
-        indices = range(max(0, i - half_window), min(len(path), i + half_window + 1))
-        avg_x = np.mean([path[j][0] for j in indices])
-        avg_y = np.mean([path[j][1] for j in indices])
-        smoothed.append((avg_x, avg_y))
-    return smoothed
+    total = np.zeros_like(points)
+    for offset in range(-half_window, half_window + 1):
+        # total[i] += points[i + offset] (超出範圍的項不加)
+        lo = max(0, -offset)
+        hi = min(n, n - offset)
+        total[lo:hi] += points[lo + offset : hi + offset]
+    index = np.arange(n)
+    count = np.minimum(index + half_window, n - 1) - np.maximum(index - half_window, 0) + 1
+    smoothed = total / count[:, None]
+    if isinstance(path, np.ndarray):
+        return smoothed
+    return [tuple(p) for p in smoothed.tolist()]
 
 
 def bezier_smooth(path, smooth_factor=0.1):
@@ -74,19 +348,21 @@ def bezier_smooth(path, smooth_factor=0.1):
 def recalc_headings(path):
     """
     根據路徑計算每個步驟的航向（以度表示），向上為 0 度，並順時鐘增加
+    path 可為 (N, 2) 陣列、(N, 4) 路徑陣列 (都回傳陣列) 或座標列表 (回傳列表)。
+    np.arctan2 與 math.atan2 偶有 1 ulp 差異，航向可能與逐點計算差在末位
     """
-    headings = []
-    for i in range(len(path) - 1):
-        dx = path[i + 1][0] - path[i][0]
-        dy = path[i + 1][1] - path[i][1]
-        angle = math.degrees(math.atan2(dy, dx))
-        heading_deg = (90 - angle) % 360
-        headings.append(heading_deg)
-    if len(path) > 1:
-        headings.append(headings[-1])
+    points = _as_path_array(path)
+    if len(points) > 1:
+        delta = np.diff(points, axis=0)
+        angle = np.degrees(np.arctan2(delta[:, 1], delta[:, 0]))
+        headings = np.empty(len(points))
+        headings[:-1] = np.mod(90 - angle, 360)
+        headings[-1] = headings[-2]
     else:
-        headings.append(0.0)
-    return headings
+        headings = np.zeros(1)
+    if isinstance(path, np.ndarray):
+        return headings
+    return headings.tolist()
 
 
 def smooth_path(path, method="none"):
@@ -101,10 +377,16 @@ def smooth_path(path, method="none"):
     if len(path) <= 1:
         return path[:], [0.0] * len(path)
 
+    if method == "moving_average":
+        # 平滑與航向都以陣列計算，最後才轉回列表
+        points = moving_average_smooth(_as_path_array(path))
+        new_headings = recalc_headings(points)
+        if isinstance(path, np.ndarray):
+            return points, new_headings
+        return [tuple(p) for p in points.tolist()], new_headings.tolist()
+
     if method == "none":
         new_path = path[:]
-    elif method == "moving_average":
-        new_path = moving_average_smooth(path)
     elif method == "bezier":
         new_path = bezier_smooth(path)
     else:
@@ -114,14 +396,404 @@ def smooth_path(path, method="none"):
     return new_path, new_headings
 
 
+# --------------------
+# 包圍圈目標分配
+# --------------------
+def assign_ring_slots(positions, center, radius, offset=0.0, rotation_steps=1):
+    """
+    把 N 艘船分配到 center 周圍半徑 radius 圓上的 N 個等分位置 (角度 offset + 2π·k/N)，
+    使各船到目標的直線距離總和最小 (最小成本指派，scipy 的 linear_sum_assignment)。
+    直線距離總和最小的指派中，船與目標的連線不會互相交叉，規劃時衝突重算也較少。
+
+    positions: (N, 2) 各船位置；center: 圓心；單位不限，與 radius 相同即可
+    rotation_steps: 在 [offset, offset + 2π/N) 內等間隔試幾個旋轉角度，取總距離最小者；
+      1 則只用 offset
+    回傳 (goals, 選用的旋轉角度)：goals 為 (N, 2) 陣列，goals[i] 為第 i 艘船的目標
+    """
+    points = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    if n == 0:
+        return np.empty((0, 2)), offset
+    # (R,) 個旋轉角度 x (N,) 個位置 -> (R, N, 2) 的目標，(R, 船, 目標) 的距離
+    offsets = offset + np.arange(rotation_steps) * (2 * math.pi / n / rotation_steps)
+    theta = offsets[:, None] + (2 * math.pi / n) * np.arange(n)
+    slots = np.stack(
+        [center[0] + radius * np.cos(theta), center[1] + radius * np.sin(theta)], axis=-1
+    )
+    diff = points[None, :, None, :] - slots[:, None, :, :]
+    cost = np.hypot(diff[..., 0], diff[..., 1])
+
+    best = None
+    for r in range(rotation_steps):
+        rows, cols = linear_sum_assignment(cost[r])
+        total = cost[r, rows, cols].sum()
+        if best is None or total < best[0]:
+            best = (total, r, cols)
+    _, r, cols = best
+    return slots[r, cols], float(offsets[r])
+
+
+# multi_ship_planning 回傳的路徑陣列：float64 (N, 4)，各欄為
+# x (公尺)、y (公尺)、時間步、航向 (度)。
+# 衝突判定 (距離 < safe_distance) 一律用 float64：float32 的捨入誤差 (公尺座標約 1e-6)
+# 會讓剛好在 safe_distance 邊界的兩點改變判定結果
+PATH_COLUMNS = ("x", "y", "t", "heading")
+PATH_DTYPE = np.float64
+# 只用於儲存 (PlanCache) 與繪圖 (Boat.path，像素) 的路徑陣列，不拿來判定衝突
+PATH_STORAGE_DTYPE = np.float32
+
+
+def path_array(path, headings):
+    """
+    (x, y) 路徑與航向列表 -> float64 (N, 4) 路徑陣列，時間步欄為 0..N-1。
+    path 為空時回傳 (0, 4) 陣列
+    """
+    n = len(path)
+    record = np.empty((n, len(PATH_COLUMNS)), dtype=PATH_DTYPE)
+    if n:
+        record[:, :2] = _as_path_array(path)
+        record[:, 2] = np.arange(n)
+        record[:, 3] = headings
+    return record
+
+
 # --------------------
 # 多船規劃主函式
 # --------------------
+def split_replan(ships, previous_plans, goal_tolerance, safe_distance=1):
+    """
+    差分重算：找出可以沿用剩餘路徑、不必重新規劃的船
+    ships: 本次的船 (同 multi_ship_planning)
+    previous_plans: {船id: {"goal": 該路徑規劃時的目標 (公尺), "path": 剩餘路徑 (公尺)}}，
+      剩餘路徑為 (N, 2) 或 (N, 4) 陣列，第 0 步為目前時間步
+    goal_tolerance: 新目標與舊目標距離在此範圍內 (公尺) 才沿用
+
+    依 ships 的順序檢查，目標沒有移動超過 goal_tolerance、
+    且剩餘路徑與已決定沿用的船不衝突者沿用。
+    回傳 (沿用的 {船id: 剩餘路徑}，需要重新規劃的 ships)，
+    前者可直接作為 multi_ship_planning(fixed_paths=...)
+    """
+    kept = {}
+    kept_paths = []
+    to_plan = []
+    for ship_data in ships:
+        previous = previous_plans.get(_ship_key(ship_data))
+        if (
+            previous is not None
+            and len(previous["path"])
+            and distance(previous["goal"], ship_data["goal"]) <= goal_tolerance
+            and not paths_conflict_batch(previous["path"], kept_paths, safe_distance).any()
+        ):
+            kept[_ship_key(ship_data)] = previous["path"]
+            kept_paths.append(previous["path"])
+        else:
+            to_plan.append(ship_data)
+    return kept, to_plan
+
+
+def _ship_key(ship_data):
+    """結果 dict 中的船 key：有 id 用 id，否則以起訖點表示"""
+    ship_id = ship_data.get("id", None)
+    if not ship_id:
+        ship_id = f"{ship_data['pos']}->{ship_data['goal']}"
+    return ship_id
+
+
+def _ship_info(ship_data):
+    return {"pos": ship_data["pos"], "goal": ship_data["goal"]}
+
+
+def _new_conflicts(path_m, conflict_index, interfering_paths):
+    """已確定的船 (conflict_index) 中，尚未列為干擾船、且與 path_m 衝突者"""
+    new_conflicts = []
+    for prev_ship in conflict_index.conflicts(path_m):
+        if prev_ship not in interfering_paths:
+            # print(f"  - 發現與船 {prev_ship['id']} 衝突，加入干擾重算。")
+            new_conflicts.append(prev_ship)
+    return new_conflicts
+
+
+def _plan_group(task):
+    """
+    平行規劃的工作單位 (在子行程中執行，參數與回傳值都必須可 pickle)：
+    以 solver="retry" 的規則依序規劃同一組的船，只與組內的船比對衝突。
+    task: (ship_items, safe_distance, grid_scale, planner_kwargs,
+           use_distance_field, distance_fields, warm_start, seeds, reused)
+      seeds: {船id: (路徑, 航向, analysis)}，上一輪已算好的第一次嘗試 (不帶干擾船)。
+        第一次嘗試與其他船無關，直接沿用；沒有衝突的船不必再搜索，
+        有衝突時直接帶著衝突船建立規劃器 (與追加干擾船後重算相同)。warm_start 時不使用
+      reused: {船id: 本函式的回傳值}，組內排在最前面、結果不受其他船影響的船，照原結果沿用
+    回傳 {船id: (路徑, 航向, analysis, 各次嘗試的路徑, DistanceField, 第一次嘗試)}，
+    路徑為 (N, 2) float64 陣列、航向為 (N,) 陣列，第一次嘗試的格式同 seeds
+    """
+    (
+        ship_items,
+        safe_distance,
+        grid_scale,
+        planner_kwargs,
+        use_distance_field,
+        distance_fields,
+        warm_start,
+        seeds,
+        reused,
+    ) = task
+    results = {}
+    previous_planned_paths = []
+    conflict_index = _conflict_checker(safe_distance, len(ship_items))
+    for ship_id, ship_info in ship_items:
+        if ship_id in reused:
+            results[ship_id] = reused[ship_id]
+            path = results[ship_id][0]
+            if len(path):
+                previous_planned_paths.append(
+                    {
+                        "id": ship_id,
+                        "path": [tuple(p) for p in path.tolist()],
+                        "headings": results[ship_id][1].tolist(),
+                    }
+                )
+                conflict_index.add(previous_planned_paths[-1])
+            continue
+
+        seed = None if warm_start else seeds.get(ship_id)
+        planner = None
+        interfering_paths = []
+        if seed is None:
+            planner = n_fcc_a(
+                ship_info=ship_info,
+                interfering_paths=[],
+                grid_scale=grid_scale,
+                use_distance_field=use_distance_field,
+                distance_field=distance_fields.get(ship_id),
+                keep_search_tree=warm_start,
+                **planner_kwargs,
+            )
+            path_m, headings = planner.calculate_path()
+            first = (path_m, headings, planner.analysis)
+        else:
+            first = seed
+            path_m, headings, analysis = seed
+        attempts = [path_m]
+        warm = warm_start
+        warmed = False
+        while path_m:
+            new_conflicts = _new_conflicts(path_m, conflict_index, interfering_paths)
+            if not new_conflicts:
+                break
+            interfering_paths.extend(new_conflicts)
+            if planner is None:
+                planner = n_fcc_a(
+                    ship_info=ship_info,
+                    interfering_paths=list(interfering_paths),
+                    grid_scale=grid_scale,
+                    use_distance_field=use_distance_field,
+                    distance_field=distance_fields.get(ship_id),
+                    **planner_kwargs,
+                )
+            else:
+                planner.add_interfering_paths(new_conflicts, warm_start=warm)
+                warmed = warm
+            path_m, headings = planner.calculate_path()
+            attempts.append(path_m)
+            if warmed and path_m and not _new_conflicts(path_m, conflict_index, interfering_paths):
+                if conflict_index.conflicts(path_m):
+                    # 熱啟動的路徑仍有衝突：改用完整重新搜索，之後不再熱啟動
+                    warm = warmed = False
+                    path_m, headings = planner.calculate_path()
+                    attempts.append(path_m)
+        if planner is not None:
+            analysis = planner.analysis
+        results[ship_id] = (
+            _as_path_array(path_m),
+            np.asarray(headings, dtype=np.float64),
+            analysis,
+            [_as_path_array(p) for p in attempts if p],
+            planner.distance_field if planner is not None else distance_fields.get(ship_id),
+            first,
+        )
+        if path_m:
+            previous_planned_paths.append(
+                {"id": ship_id, "path": path_m, "headings": headings}
+            )
+            conflict_index.add(previous_planned_paths[-1])
+    return results
+
+
+def _timed_plan_group(task):
+    """_plan_group 並量測耗時 (秒)：回傳 (耗時, 結果)"""
+    t0 = time.perf_counter()
+    results = _plan_group(task)
+    return time.perf_counter() - t0, results
+
+
+def _parallel_retry(
+    ship_items,
+    safe_distance,
+    grid_scale,
+    planner_kwargs,
+    use_distance_field,
+    distance_field_cache,
+    warm_start,
+    workers,
+    cancel=None,
+    executor=None,
+):
+    """
+    solver="retry" 的平行版本。結果與依序規劃相同：
+
+      1. 每艘船先自成一組。各船第一次嘗試都不帶干擾船，彼此獨立，以 process pool 同時規劃
+      2. 依規劃順序檢查：某船的任一次嘗試路徑若與「排在它前面、但在別組」的船的最終路徑衝突，
+         依序規劃時那艘船會被加入干擾重算，結果可能不同 -> 兩組合併，下一輪重新規劃
+         (以 paths_conflict_batch 一次比對所有較早的別組船)
+      3. 沒有需要合併的組即完成；組只會合併，最多 len(ship_items) 輪
+
+    組內只與組內的船比對衝突，沒有組間衝突時和依序規劃的計算完全相同。
+    合併後的組不從頭重算 (見 _plan_group)：
+      - 組內排在最前面、都來自同一個舊組的船，結果與舊組相同，直接沿用
+      - 其餘的船沿用第一輪的第一次嘗試，只有與組內較早的船衝突者才重新搜索
+    合併組內的衝突重算仍須依序進行，是多核心時的關鍵路徑：耗時主要在衝突重算，
+    第一次嘗試只佔一小部分，即使核心數不限 (stats["critical_path"]) 也只比依序規劃
+    略快 (benchmark.py parallel_retry：demo 約 0.37s 對 0.47s，encirclement 幾乎相同)。
+    包圍情境中多數船的路徑互不相交，第一輪後通常只剩少數幾組需要重算。
+    cancel 在每一輪開始前檢查；被取消時只回傳已確定 (不需再重算) 的組。
+    executor: 呼叫端保留的 ProcessPoolExecutor，給定時沿用它 (不另建、也不關閉)，忽略 workers
+    回傳 ({船id: (路徑, 航向, analysis)}, stats)；stats["critical_path"] 為各輪最久的一組的
+    耗時總和 (秒)，即核心數不限時的規劃耗時 (不含 process pool 的傳遞成本)
+    """
+    order = {ship_id: i for i, (ship_id, _) in enumerate(ship_items)}
+    infos = dict(ship_items)
+    groups = [[ship_id] for ship_id, _ in ship_items]
+    stats = {
+        "workers": workers,
+        "groups": len(groups),
+        "rounds": 0,
+        "merges": 0,
+        "reused": 0,
+        "critical_path": 0.0,
+        "cancelled": False,
+    }
+    planned = {}  # {船id: (路徑, 航向, analysis, 路徑陣列, 各次嘗試的路徑陣列)}
+    group_results_of = {}  # {船id: _plan_group 的結果}
+    first_attempts = {}  # {船id: 第一次嘗試 (不帶干擾船)}
+    pending = groups
+    reusable = {}  # {船id: 合併後仍可沿用的結果}
+
+    owns_executor = executor is None and workers > 1
+    if owns_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while pending:
+            if cancel is not None and cancel.cancelled:
+                stats["cancelled"] = True
+                for group in pending:
+                    for ship_id in group:
+                        planned.pop(ship_id, None)
+                break
+            stats["rounds"] += 1
+            tasks = [
+                (
+                    [(ship_id, infos[ship_id]) for ship_id in group],
+                    safe_distance,
+                    grid_scale,
+                    planner_kwargs,
+                    use_distance_field,
+                    {i: distance_field_cache[i] for i in group if i in distance_field_cache},
+                    warm_start,
+                    {i: first_attempts[i] for i in group if i in first_attempts},
+                    {i: reusable[i] for i in group if i in reusable},
+                )
+                for group in pending
+            ]
+            stats["reused"] += sum(len(task[-1]) for task in tasks)
+            if executor is None or len(tasks) == 1:
+                timed_results = [_timed_plan_group(task) for task in tasks]
+            else:
+                timed_results = list(executor.map(_timed_plan_group, tasks))
+            stats["critical_path"] += max(elapsed for elapsed, _ in timed_results)
+            for _, result in timed_results:
+                for ship_id, ship_result in result.items():
+                    path, headings, analysis, attempts, field, first = ship_result
+                    group_results_of[ship_id] = ship_result
+                    first_attempts[ship_id] = first
+                    path_m = [tuple(p) for p in path.tolist()]
+                    planned[ship_id] = (path_m, headings.tolist(), analysis, path, attempts)
+                    if field is not None:
+                        distance_field_cache[ship_id] = field
+
+            # 找出需要合併的組
+            group_of = {ship_id: gi for gi, group in enumerate(groups) for ship_id in group}
+            merge_pairs = set()
+            for ship_id, _ in ship_items:
+                earlier = [
+                    prev_id
+                    for prev_id, _ in ship_items[: order[ship_id]]
+                    if planned[prev_id][0] and group_of[prev_id] != group_of[ship_id]
+                ]
+                if not earlier:
+                    continue
+                others = [planned[prev_id][3] for prev_id in earlier]
+                hit = np.zeros(len(earlier), dtype=bool)
+                for attempt in planned[ship_id][4]:
+                    hit |= paths_conflict_batch(attempt, others, safe_distance)
+                for prev_id in itertools.compress(earlier, hit):
+                    merge_pairs.add((group_of[prev_id], group_of[ship_id]))
+            if not merge_pairs:
+                break
+            parent = list(range(len(groups)))
+
+            def find(i):
+                while parent[i] != i:
+                    i = parent[i]
+                return i
+
+            for a, b in merge_pairs:
+                parent[find(b)] = find(a)
+            merged = {}
+            for gi, group in enumerate(groups):
+                merged.setdefault(find(gi), []).extend(group)
+            stats["merges"] += len(groups) - len(merged)
+            pending = []
+            new_groups = []
+            reusable = {}
+            for root, members in merged.items():
+                members.sort(key=order.get)
+                new_groups.append(members)
+                if len(members) > len(groups[root]):
+                    pending.append(members)
+                    # 排在最前面、同屬一個舊組的船只受彼此影響，結果不變
+                    head_group = group_of[members[0]]
+                    for ship_id in members:
+                        if group_of[ship_id] != head_group:
+                            break
+                        reusable[ship_id] = group_results_of[ship_id]
+            groups = new_groups
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+    stats["groups"] = len(groups)
+    solution = {
+        ship_id: (path_m, headings, analysis)
+        for ship_id, (path_m, headings, analysis, _, _) in planned.items()
+    }
+    return solution, stats
+
+
 def multi_ship_planning(
     ships,
     safe_distance=1,
     grid_scale=0.2,
     smoothing_method="none",
+    planner_kwargs=None,
+    use_distance_field=False,
+    distance_field_cache=None,
+    planners=None,
+    warm_start=False,
+    solver="retry",
+    solver_kwargs=None,
+    cancel=None,
+    fixed_paths=None,
+    executor=None,
 ):
     """
     ships: list，裡面每個元素是一艘船的資訊，結構例如：
@@ -136,12 +808,59 @@ def multi_ship_planning(
       2. 規劃每艘船時，先嘗試不加任何干擾路徑。若發現與前面船的路徑有衝突(距離 < safe_distance)，
          則將「有衝突的船路徑」加入 interfering_paths，再重算。反覆至無新衝突為止。
       3. 完成後將結果存入 planning_results；並將新船的路徑存入 previous_planned_paths 以供後續比對。
+         若找不到路徑(例如 bounded 模式下目標不可達)，該船的 path 為空 ((0, 4) 陣列)，也不列入後續比對。
+
+    planner_kwargs: dict，額外傳給 n_fcc_a 的參數，例如 {"bounded": True, "max_steps": 400}。
+      即時重算不需要路徑分析時可給 {"analysis": "off"}，結果的 analysis 只有搜索統計
+    use_distance_field: 是否以反向 Dijkstra 距離表 (DistanceField) 作為各船的距離啟發式。
+      只在 planner_kwargs 有 {"bounded": True} 時有效，否則忽略 (見 n_fcc_a)
+    distance_field_cache: dict，{船id: DistanceField}。由呼叫端在多次規劃間保留，
+      目標移動不到一格 (目標格不變) 時即沿用上一次的距離表，不必重算
+    planners: dict，{船id: IncrementalPlanner}。由呼叫端在多次規劃間保留，
+      各船沿用上一次的搜索樹做修補，並預先帶入上一次參照過的干擾船；
+      沒有的船會自動建立
+    warm_start: 衝突重算時是否從上一次的搜索樹繼續 (見 n_fcc_a.add_interfering_paths)。
+      只對 fcc_mode="heuristic" 有效。這是以衝突消解換取速度：已展開的節點不會重新展開，
+      熱啟動的路徑可能仍與已參照的干擾船衝突；此時該船改用完整重新搜索再算一次
+      (之後的衝突重算也不再熱啟動)，只在熱啟動的結果本身無衝突時才省下時間
+
+    衝突重算時沿用同一個 n_fcc_a，只追加新衝突的干擾船 (未給 planners 時)，
+    格座標、搜索區域與 FCC 記憶表都不必重算。
+    solver: 多船協調方式
+      - "retry"：上述規則 2，發現衝突就把該船當作干擾船重算。
+        solver_kwargs 給 "workers" 時改為平行規劃 (見 _parallel_retry)：互不影響的船分組後
+        以 process pool 同時規劃，發現組間有影響時合併重算，結果與依序規劃相同；
+        統計放在每艘船的 analysis["parallel"]。不支援 planners
+      - "cooperative"：cooperative A*。每艘船確定路徑後寫入時空預約表 (ReservationTable)，
+        後面的船搜索時直接避開被預約的 (x, y, t)，不需衝突重算；不使用干擾船 FCC。
+        預約使船無路可走時，改為不考慮預約規劃 (analysis["reservation_fallback"] 為 True)。
+        不支援 planners / warm_start。限制：
+          * 沒有「原地等待」的動作，船只能繞開被預約的格子，路徑較長、搜索也較慢
+            (benchmark.py solvers：demo 約 17s，retry 約 0.3s；包圍情境慢 1.3 ~ 6 倍)
+          * 不計 FCC，路徑只保證不進入安全距離，與 "retry" 的路徑 (含 FCC) 成本不可直接比較
+      - "cbs"：Conflict-Based Search (見 cbs_solver.py)，不依優先順序，
+        各船的低層 n_fcc_a 搜索以 process pool 平行執行；有節點數與時間上限 (time_limit)，
+        用完時回傳衝突最少的解。求解統計放在每艘船的 analysis["cbs"]。不支援 planners / warm_start。
+        限制：低層搜索帶時間維度，約束多時容易超過低層時間上限；demo 情境會用完 time_limit，
+        回傳的解衝突不一定比 "retry" 少 (benchmark.py solvers)
+    solver_kwargs: dict，傳給 solver 的額外參數，例如 "cbs" 的 {"max_nodes": 200, "time_limit": 5.0, "workers": 4}、
+      "retry" 的 {"workers": 4} (<= 1 則在本行程依序規劃各組)
+    cancel: CancellationToken (見 multi_ship_planner_v1)，可由其他執行緒取消或設定 deadline。
+      被取消時提早回傳：已完成的船照常回傳；搜索被中斷的船 path 為空陣列，
+      analysis["search_stats"]["cancelled"] 為 True；尚未開始規劃的船不在結果中。
+      平行規劃與 "cbs" 在每一輪 / 每個約束樹節點之間檢查
+    fixed_paths: dict，{船id: 路徑陣列 (公尺，第 0 步為目前時間步)}。不重新規劃、照原路徑走的船
+      (見 split_replan)：視同最先確定的船，ships 中的船與其衝突時把它當作干擾船重算
+      (cooperative 則預約其路徑)。路徑為 (N, 4) 陣列時航向取自第 4 欄，否則重新計算。
+      這些船不在回傳結果中。不支援 "cbs" 與平行規劃
+    executor: 呼叫端保留的 ProcessPoolExecutor，"cbs" 沿用它執行低層搜索 (見 cbs_solve)、
+      平行的 "retry" 沿用它規劃各組 (見 _parallel_retry)，不必每次規劃都重新啟動 process pool
 
     回傳:
       {
         "船id或index": {
-          "path": [(x,y), (x,y), ...],   # 船之路徑(公尺)
-          "headings": [h1, h2, ...],       # 對應之航向(度)
+          "path": ndarray (N, 4) float64, # 每列為 (x(公尺), y(公尺), 時間步, 航向(度))，見 path_array
+          "headings": ndarray (N,),        # path[:, 3] 的 view
           "analysis": {...}                # (可選) n_fcc_a.analysis 的資訊
         },
         ...
@@ -156,32 +875,178 @@ def multi_ship_planning(
     planning_results = {}
 
     # 用來存已經「確定」的路徑，以供後續船做衝突比對
+    # (conflict_index：船多時為時空雜湊 PathConflictIndex，見 _conflict_checker)
     previous_planned_paths = []
+    conflict_index = _conflict_checker(safe_distance, len(ships) + len(fixed_paths or ()))
+
+    if solver not in SOLVERS:
+        raise ValueError(f"solver 必須是 {SOLVERS} 之一，收到 {solver!r}")
+    if solver != "retry" and planners is not None:
+        raise ValueError(f"solver={solver!r} 不支援 planners")
+    if solver_kwargs is None:
+        solver_kwargs = {}
+    if planner_kwargs is None:
+        planner_kwargs = {}
+    if distance_field_cache is None:
+        distance_field_cache = {}
+    reservations = ReservationTable(safe_distance, grid_scale)
+
+    if fixed_paths:
+        if solver == "cbs" or "workers" in solver_kwargs:
+            raise ValueError("fixed_paths 只支援依序規劃的 \"retry\" 與 \"cooperative\"")
+        for ship_id, path in fixed_paths.items():
+            if not len(path):
+                continue
+            points = _as_path_array(path)
+            if np.ndim(path) == 2 and np.shape(path)[1] == len(PATH_COLUMNS):
+                headings = np.asarray(path, dtype=np.float64)[:, 3].tolist()
+            else:
+                headings = recalc_headings(points).tolist()
+            previous_planned_paths.append(
+                {"id": ship_id, "path": [tuple(p) for p in points.tolist()], "headings": headings}
+            )
+            conflict_index.add(previous_planned_paths[-1])
+            if solver == "cooperative":
+                reservations.reserve_path(previous_planned_paths[-1]["path"])
+
+    if solver == "retry" and "workers" in solver_kwargs:
+        if planners is not None:
+            raise ValueError('solver_kwargs["workers"] 不支援 planners')
+        solution, parallel_stats = _parallel_retry(
+            [(_ship_key(ship_data), _ship_info(ship_data)) for ship_data in sorted_ships],
+            safe_distance,
+            grid_scale,
+            planner_kwargs,
+            use_distance_field,
+            distance_field_cache,
+            warm_start,
+            solver_kwargs["workers"],
+            cancel,
+            executor,
+        )
+        for ship_data in sorted_ships:
+            ship_id = _ship_key(ship_data)
+            if ship_id not in solution:
+                continue  # 已取消
+            path_m, headings, analysis = solution[ship_id]
+            analysis["parallel"] = parallel_stats
+            planning_results[ship_id] = {
+                "path": path_m,
+                "headings": headings,
+                "analysis": analysis,
+            }
+        sorted_ships = []
+
+    if solver == "cbs":
+        solution, cbs_stats = cbs_solve(
+            [(_ship_key(ship_data), _ship_info(ship_data)) for ship_data in sorted_ships],
+            safe_distance=safe_distance,
+            grid_scale=grid_scale,
+            planner_kwargs=planner_kwargs,
+            cancel=cancel,
+            executor=executor,
+            **solver_kwargs,
+        )
+        for ship_id, (path_m, headings, analysis) in solution.items():
+            analysis["cbs"] = cbs_stats
+            planning_results[ship_id] = {
+                "path": path_m,
+                "headings": headings,
+                "analysis": analysis,
+            }
+        sorted_ships = []
 
     # 2. 逐艘規劃
     for ship_data in sorted_ships:
-        ship_id = ship_data.get("id", None)
-        if not ship_id:
-            ship_id = f"{ship_data['pos']}->{ship_data['goal']}"
+        ship_id = _ship_key(ship_data)
         # print(f"開始規劃船 {ship_id} ...")
-        ship_info = {"pos": ship_data["pos"], "goal": ship_data["goal"]}
+        ship_info = _ship_info(ship_data)
         interfering_paths = []
+        distance_field = distance_field_cache.get(ship_id)
+        incremental = None
+        if planners is not None:
+            incremental = planners.get(ship_id)
+            if incremental is None:
+                incremental = IncrementalPlanner(
+                    grid_scale=grid_scale,
+                    use_distance_field=use_distance_field,
+                    **planner_kwargs,
+                )
+                planners[ship_id] = incremental
+            # 先帶入上一次參照過、且本輪已規劃的船 (順序一致，搜索樹才能沿用)
+            planned_by_id = {p["id"]: p for p in previous_planned_paths}
+            interfering_paths = [
+                planned_by_id[i] for i in incremental.interfering_ids if i in planned_by_id
+            ]
+        planner = None
+        new_conflicts = []
+        warm = warm_start
+        warmed = False
         while True:
-            planner = n_fcc_a(
-                ship_info=ship_info,
-                interfering_paths=interfering_paths,
-                grid_scale=grid_scale,
-            )
-            path_m, headings = planner.calculate_path()
-            new_conflict_found = False
-            for prev_ship in previous_planned_paths:
-                if prev_ship not in interfering_paths:
-                    if paths_conflict(path_m, prev_ship["path"], safe_distance):
-                        # print(f"  - 發現與船 {prev_ship['id']} 衝突，加入干擾重算。")
-                        interfering_paths.append(prev_ship)
-                        new_conflict_found = True
-            if not new_conflict_found:
+            if solver == "cooperative":
+                planner = n_fcc_a(
+                    ship_info=ship_info,
+                    interfering_paths=[],
+                    grid_scale=grid_scale,
+                    use_distance_field=use_distance_field,
+                    distance_field=distance_field,
+                    reservations=reservations,
+                    **planner_kwargs,
+                )
+                path_m, headings = planner.calculate_path(cancel=cancel)
+                if not path_m and not (cancel is not None and cancel.cancelled):
+                    planner = n_fcc_a(
+                        ship_info=ship_info,
+                        interfering_paths=[],
+                        grid_scale=grid_scale,
+                        use_distance_field=use_distance_field,
+                        distance_field=planner.distance_field,
+                        **planner_kwargs,
+                    )
+                    path_m, headings = planner.calculate_path(cancel=cancel)
+                    planner.analysis["reservation_fallback"] = True
+            elif incremental is not None:
+                path_m, headings = incremental.plan(
+                    ship_info, interfering_paths, distance_field=distance_field, cancel=cancel
+                )
+                planner = incremental.planner
+            elif planner is None:
+                planner = n_fcc_a(
+                    ship_info=ship_info,
+                    interfering_paths=interfering_paths,
+                    grid_scale=grid_scale,
+                    use_distance_field=use_distance_field,
+                    distance_field=distance_field,
+                    keep_search_tree=warm_start,
+                    **planner_kwargs,
+                )
+                path_m, headings = planner.calculate_path(cancel=cancel)
+            else:
+                # 沿用同一個規劃器，只追加新衝突的干擾船
+                planner.add_interfering_paths(new_conflicts, warm_start=warm)
+                path_m, headings = planner.calculate_path(cancel=cancel)
+                warmed = warm
+            # 衝突重算時目標不變，距離表可沿用 (範圍不足時 n_fcc_a 會自行重建)
+            distance_field = planner.distance_field
+            if distance_field is not None:
+                distance_field_cache[ship_id] = distance_field
+            cancelled = cancel is not None and cancel.cancelled
+            if not path_m or solver == "cooperative" or cancelled:
+                # 找不到路徑無法再做衝突比對；cooperative 模式已避開所有預約，不需比對
+                break
+            new_conflicts = _new_conflicts(path_m, conflict_index, interfering_paths)
+            if not new_conflicts and warmed and conflict_index.conflicts(path_m):
+                # 熱啟動的路徑仍與已參照的干擾船衝突：改用完整重新搜索，之後不再熱啟動
+                warm = warmed = False
+                path_m, headings = planner.calculate_path(cancel=cancel)
+                if not path_m or (cancel is not None and cancel.cancelled):
+                    break
+                new_conflicts = _new_conflicts(path_m, conflict_index, interfering_paths)
+            if not new_conflicts:
                 break
+            interfering_paths.extend(new_conflicts)
+        if incremental is not None:
+            incremental.interfering_ids = [p["id"] for p in interfering_paths]
         # print(
         #     f"船 {ship_id} 規劃完成！路徑長度={len(path_m)} 步\n"
         #     f"參照路徑: {', '.join([str(p['id']) for p in interfering_paths])}\n"
@@ -192,22 +1057,30 @@ def multi_ship_planning(
             "headings": headings,
             "analysis": planner.analysis,
         }
-        previous_planned_paths.append(
-            {"id": ship_id, "path": path_m, "headings": headings}
-        )
+        if path_m:
+            previous_planned_paths.append(
+                {"id": ship_id, "path": path_m, "headings": headings}
+            )
+            conflict_index.add(previous_planned_paths[-1])
+            if solver == "cooperative":
+                reservations.reserve_path(path_m)
+        if cancelled:
+            break
 
-    # 3. 規劃完所有船後，再對所有結果進行平滑化（smoothing_method=="none"則直接保持原狀）
+    # 3. 規劃完所有船後，再對所有結果進行平滑化（smoothing_method=="none"則直接保持原狀），
+    #    並轉成 (N, 4) 路徑陣列；"headings" 是其航向欄的 view，不另外複製
     for ship_id in planning_results:
         raw_path, raw_headings = (
             planning_results[ship_id]["path"],
             planning_results[ship_id]["headings"],
         )
         if smoothing_method != "none":
-            new_path, new_headings = smooth_path(raw_path, method=smoothing_method)
+            new_path, new_headings = smooth_path(_as_path_array(raw_path), method=smoothing_method)
         else:
             new_path, new_headings = raw_path, raw_headings
-        planning_results[ship_id]["path"] = new_path
-        planning_results[ship_id]["headings"] = new_headings
+        record = path_array(new_path, new_headings)
+        planning_results[ship_id]["path"] = record
+        planning_results[ship_id]["headings"] = record[:, 3]
 
     return planning_results
 
@@ -276,9 +1149,8 @@ def main():
     all_x = []
     all_y = []
     for sid, data in results.items():
-        for px, py in data["path"]:
-            all_x.append(px)
-            all_y.append(py)
+        all_x.extend(data["path"][:, 0].tolist())
+        all_y.extend(data["path"][:, 1].tolist())
     margin_m = 3
     min_x = int(min(all_x)) - margin_m
     max_x = int(max(all_x)) + margin_m
@@ -337,12 +1209,10 @@ def main():
 
         # 畫每艘船的航跡與步數
         for sid, data in results.items():
-            path = data["path"]
-            headings = data["headings"]
             col = color_map[sid]
-            for i, (px, py) in enumerate(path):
+            for i, (px, py, _, heading) in enumerate(data["path"].tolist()):
                 sx, sy = trans_to_screen(px, py)
-                draw_arrow(screen, col, (sx, sy), headings[i], 10)
+                draw_arrow(screen, col, (sx, sy), heading, 10)
                 step_txt = font.render(str(i), True, col)
                 screen.blit(step_txt, (sx + 2, sy + 2))
 